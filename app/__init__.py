@@ -1,17 +1,48 @@
-from flask import Flask
+from flask import Flask, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from .config import Config
-from .extensions import db, jwt, cors, migrate
+from .extensions import db, jwt, cors, migrate, redis_client, replica_router
 from .routes import register_routes
+from .utils.uploads import UploadRequest
+from .utils.json_provider import FastJSONProvider
+from .commands import register_commands
+from .services.search import search_engine
+from .services.suggest import suggest_index
+from .services.admission import admission_control
+from .services.cache import response_cache
+from .services.thumbnails import derivative_pipeline
+from .services.reclaim import storage_reclaimer
+from .services.bulk_import import bulk_importer
+from .services.passwords import password_hasher
+from .services.revocation import revocation_cache
+from .services.identity import identity_cache
+from .services.metrics import metrics
+from .services.compression import response_compressor
 import os
 
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.request_class = UploadRequest
+    app.json = FastJSONProvider(app)
+    app.config.from_object(config_class)
 
+    replica_router.init_app(app)
     db.init_app(app)
+    replica_router.install_engine_hooks(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    redis_client.observer = metrics.observe_redis
+    redis_client.init_app(app)
+    revocation_cache.init_app(app)
+    identity_cache.init_app(app)
+    search_engine.init_app(app)
+    suggest_index.init_app(app)
+    response_cache.init_app(app)
+    derivative_pipeline.init_app(app)
+    storage_reclaimer.init_app(app)
+    bulk_importer.init_app(app)
+    password_hasher.init_app(app)
     cors.init_app(app, resources={
         r"/api/*": {
             "origins": [
@@ -26,8 +57,20 @@ def create_app():
 
     upload_folder = os.path.join(os.getcwd(), "uploads", "avas")
     os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
 
     register_routes(app)
+    register_commands(app)
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        # Raised while an upload streams in, the client gets the limit it hit in the usual JSON shape
+        return jsonify(msg=e.description), 413
+    metrics.init_app(app)
+    # After metrics, so shed requests are still timed and counted
+    admission_control.init_app(app)
+    # Registered last so it runs first among after_request hooks and metrics see the bytes on the wire
+    response_compressor.init_app(app)
 
     return app
 
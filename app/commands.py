@@ -0,0 +1,68 @@
+import click
+from .services.post_service import backfill_post_images, backfill_post_locations
+from .services.query_plans import feed_query_plans
+from .services.reclaim import UploadSweeper
+from .services.storage import migrate_legacy_uploads
+from .services.suggest import suggest_index
+from .services.thumbnails import derivative_pipeline
+
+
+def register_commands(app):
+    @app.cli.command('backfill-post-images')
+    @click.option('--batch-size', default=500, show_default=True)
+    def backfill_post_images_command(batch_size):
+        """Fill the post_images manifest from the existing uploads/posts/<id> directories."""
+        scanned, created = backfill_post_images(batch_size)
+        click.echo(f'Scanned {scanned} posts, created {created} image records')
+
+    @app.cli.command('regenerate-derivatives')
+    @click.option('--batch-size', default=200, show_default=True)
+    def regenerate_derivatives_command(batch_size):
+        """Render thumbnail and card variants for every stored post image and avatar."""
+        rendered, failed = derivative_pipeline.regenerate(batch_size)
+        click.echo(f'Rendered {rendered} images, {failed} failed')
+
+    @app.cli.command('backfill-post-locations')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def backfill_post_locations_command(batch_size):
+        """Copy each seller's profile location onto their posts."""
+        updated = backfill_post_locations(batch_size)
+        click.echo(f'Updated {updated} posts')
+
+    @app.cli.command('check-feed-indexes')
+    def check_feed_indexes_command():
+        """EXPLAIN every supported feed filter and sort combination and fail on full scans or in-memory sorts."""
+        failed = 0
+        for label, plan in feed_query_plans():
+            status = 'FULL SCAN' if plan.full_scan else 'FILESORT' if plan.filesort else 'ok'
+            click.echo(f'{label:<48} {status:<10} {",".join(plan.indexes) or "-"}')
+            failed += plan.full_scan or plan.filesort
+        if failed:
+            raise click.ClickException(f'{failed} feed queries are not read off an index in order')
+
+    @app.cli.command('sweep-uploads')
+    @click.option('--batch-size', default=500, show_default=True)
+    @click.option('--min-age', default=3600, show_default=True, help='Seconds since last modification')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+    def sweep_uploads_command(batch_size, min_age, dry_run):
+        """Remove files under uploads/ that no post or profile refers to, safe to run from cron."""
+        report = UploadSweeper(app.config['UPLOAD_FOLDER'], app.config['UPLOAD_STAGING_FOLDER'],
+                               batch_size, min_age, dry_run).run()
+        verb = 'Would free' if dry_run else 'Freed'
+        click.echo(f'{verb} {report["bytes"] / (1024 * 1024):.2f} MB: {report["files"]} files, '
+                   f'{report["dirs"]} directories, {report["skipped_recent"]} recent entries skipped')
+
+    @app.cli.command('migrate-to-object-store')
+    @click.option('--batch-size', default=200, show_default=True)
+    def migrate_to_object_store_command(batch_size):
+        """Move post images and avatars stored under fixed names into the content-addressed store."""
+        report = migrate_legacy_uploads(batch_size)
+        click.echo(f'Stored {report["stored"]} files, {report["deduplicated"]} were duplicates, '
+                   f'{report["missing"]} missing on disk, saved {report["bytes_saved"] / (1024 * 1024):.2f} MB')
+
+    @app.cli.command('build-suggest-index')
+    def build_suggest_index_command():
+        """Build the search box completions and write SUGGEST_SNAPSHOT_PATH for the workers to load."""
+        indexed = suggest_index.rebuild()
+        where = f', snapshot written to {suggest_index.snapshot_path}' if suggest_index.snapshot_path else ''
+        click.echo(f'Indexed {indexed} terms{where}')
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 from os import getenv, getcwd, path
+from tempfile import gettempdir
 
 
 load_dotenv()
@@ -10,9 +11,103 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = 3600
     SQLALCHEMY_DATABASE_URI = getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Comma separated, e.g. mysql://reader@replica1/db,mysql://reader@replica2/db
+    DATABASE_REPLICA_URLS = [url.strip() for url in getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_STICKY_SECONDS = 5
+    REPLICA_HEALTH_CHECK_SECONDS = 10
+    REPLICA_CONNECT_TIMEOUT = 2
     CORS_SUPPORTS_CREDENTIALS = True
     UPLOAD_FOLDER = path.join(getcwd(), 'uploads')
+    UPLOAD_STAGING_FOLDER = path.join(UPLOAD_FOLDER, 'staging')
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ["access", "refresh"]
+    IDENTITY_CACHE_TTL = 30
+    IDENTITY_CACHE_MAX_ENTRIES = 10000
+    IDENTITY_CACHE_SYNC_SECONDS = 1
+    # Snapshots are bypassed while invalidations could not be pulled from Redis for this long
+    IDENTITY_CACHE_MAX_STALENESS = 5
+    JWT_REVOCATION_SYNC_SECONDS = 5
+    JWT_REVOCATION_RETENTION = 7 * 24 * 3600
+    # Every token is rejected while the blocklist could not be pulled from Redis for this long, None never rejects
+    JWT_REVOCATION_MAX_STALENESS = 30
+    REDIS_URL = getenv('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_MAX_CONNECTIONS = 20
+    REDIS_SOCKET_TIMEOUT = 0.5
+    REDIS_CONNECT_TIMEOUT = 0.5
+    POSTS_PER_PAGE = int(getenv('POSTS_PER_PAGE', 10))
+    POSTS_MAX_PAGE_SIZE = 50
+    BATCH_MAX_IDS = 50
+    # The FULLTEXT index exists only on MySQL, every other database is searched in memory
+    SEARCH_BACKEND = getenv('SEARCH_BACKEND', 'mysql' if (SQLALCHEMY_DATABASE_URI or '').startswith('mysql') else 'memory')
+    SEARCH_TOTAL_CAP = 1000
+    SEARCH_INDEX_REFRESH_SECONDS = 300
+    SUGGEST_MAX_TERMS = 50000
+    SUGGEST_MIN_PREFIX = 2
+    SUGGEST_SCAN_LIMIT = 2000
+    SUGGEST_LIMIT = 8
+    SUGGEST_MAX_LIMIT = 20
+    SUGGEST_REFRESH_SECONDS = 300
+    SUGGEST_SNAPSHOT_PATH = getenv('SUGGEST_SNAPSHOT_PATH')  # shared by the workers of one host
+    WEB_CONCURRENCY = int(getenv('WEB_CONCURRENCY', 1))  # gunicorn workers per host, read by gunicorn itself
+    # 'memory' invalidates only the worker that handled the write, for tests and single-process servers only
+    CACHE_BACKEND = getenv('CACHE_BACKEND', 'redis' if getenv('REDIS_URL') else 'memory')
+    CACHE_REDIS_URL = getenv('CACHE_REDIS_URL')  # falls back to the shared REDIS_URL pool
+    CACHE_TTL = 30
+    CACHE_MAX_ENTRIES = 2048
+    CACHE_ROUTES = {'feed': True, 'post': True, 'profile': True}
+    IMAGE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+    IMAGE_SENDFILE_BACKEND = getenv('IMAGE_SENDFILE_BACKEND')  # 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+    IMAGE_ACCEL_REDIRECT_PREFIX = '/protected/'
+    THUMBNAIL_SIZES = {'thumb': 200, 'card': 480}
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_WORKERS = 2
+    THUMBNAIL_QUEUE_LIMIT = 64
+    RECLAIM_WORKERS = 1
+    IMPORT_CHUNK_SIZE = 200
+    IMPORT_MAX_ROWS = 5000
+    IMPORT_IMAGE_WORKERS = 4
+    RECLAIM_QUEUE_LIMIT = 256
+    # Any werkzeug method string with explicit cost, e.g. 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_METHOD = getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_LIMIT = 8  # per worker
+    # Hashes in flight across every worker, counted in Redis. None leaves only the per worker limit
+    PASSWORD_HASH_GLOBAL_LIMIT = 16
+    PASSWORD_HASH_TIMEOUT = 10
+    METRICS_MULTIPROC_DIR = getenv('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_SECONDS = 5
+    METRICS_TOKEN = getenv('METRICS_TOKEN')  # scrapers send it as a bearer token, /metrics is off without one
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = ('application/json', 'text/plain', 'text/html')
+    SLOW_REQUEST_MS = int(getenv('SLOW_REQUEST_MS')) if getenv('SLOW_REQUEST_MS') else None
+    # rate: tokens per second per client, burst: bucket size, concurrency: requests of the class running
+    # at once across the workers of a host, or of every host with ADMISSION_SYNC = 'redis'
+    ADMISSION_CLASSES = {
+        'auth': {'rate': 0.5, 'burst': 10, 'concurrency': 2},
+        'search': {'rate': 2, 'burst': 20, 'concurrency': 4},
+        'upload': {'rate': 0.2, 'burst': 5, 'concurrency': 2}
+    }
+    # Endpoints that are not listed are not limited
+    ADMISSION_ROUTES = {
+        'auth.login': 'auth',
+        'auth.register': 'auth',
+        'posts.get_searched_posts': 'search',
+        'posts.create_post': 'upload',
+        'posts.import_posts': 'upload',
+        'profile.upload_ava': 'upload'
+    }
+    # 'redis' shares buckets and slots between workers and hosts, 'local' keeps buckets per worker and
+    # slots per host in ADMISSION_LOCK_DIR
+    ADMISSION_SYNC = getenv('ADMISSION_SYNC', 'redis' if getenv('REDIS_URL') else 'local')
+    ADMISSION_LOCK_DIR = getenv('ADMISSION_LOCK_DIR', path.join(gettempdir(), 'bazarchik-admission'))
+    # Proxies that append to X-Forwarded-For, the hosting platform's router is one. With 0 every client
+    # shares the proxy's address and therefore one bucket, set it only when clients connect directly
+    ADMISSION_TRUSTED_PROXIES = int(getenv('ADMISSION_TRUSTED_PROXIES', 1))
+    ADMISSION_MAX_CLIENTS = 10000
+    ADMISSION_BUSY_RETRY_AFTER = 1
+    ADMISSION_SLOT_LEASE_SECONDS = 120
 
 
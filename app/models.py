@@ -1,5 +1,11 @@
 from .extensions import db
 from datetime import datetime, timezone
+from sqlalchemy.dialects import mysql
+import os
+
+
+# Microseconds on MySQL too, two edits within one second must not share an ETag
+VersionStamp = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
 
 
 class User(db.Model):
@@ -10,7 +16,8 @@ class User(db.Model):
     password = db.Column(db.String(256), nullable=False)
     reg_datetime = db.Column(db.DateTime, default=lambda : datetime.now(timezone.utc))
     profile = db.relationship('Profile', backref='user', uselist=False, cascade='all, delete')
-    posts = db.relationship('Post', backref='creator', uselist=True, cascade='all, delete')
+    # A query rather than a list, sellers can have thousands of posts, see post_service.seller_inventory
+    posts = db.relationship('Post', backref='creator', lazy='dynamic', cascade='all, delete')
 
 
 class Profile(db.Model):
@@ -26,10 +33,23 @@ class Profile(db.Model):
     phone_number = db.Column(db.String(14))
     location = db.Column(db.String(100))
     img_path = db.Column(db.String(255))
+    ava_variants = db.Column(db.Boolean, nullable=False, default=False)
+    ava_object_id = db.Column(db.Integer, db.ForeignKey('stored_objects.id'))
+    updated_at = db.Column(VersionStamp, default=lambda : datetime.now(timezone.utc),
+                           onupdate=lambda : datetime.now(timezone.utc))
 
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_creation_date_id_price', 'creation_date', 'id', 'price'),
+        db.Index('ix_posts_creator_id_creation_date_id', 'creator_id', 'creation_date', 'id'),
+        db.Index('ix_posts_price_id', 'price', 'id'),
+        db.Index('ix_posts_location_creation_date_id_price', 'location', 'creation_date', 'id', 'price'),
+        db.Index('ix_posts_location_price_id', 'location', 'price', 'id'),
+        db.Index('ix_posts_title_description_fulltext', 'title', 'description',
+                 mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -38,5 +58,59 @@ class Post(db.Model):
     price = db.Column(db.Numeric(10, 2), nullable=False)
     description = db.Column(db.String(1500))
     img_path = db.Column(db.String(255))
+    # Copy of the seller's Profile.location so the feed can filter on it without joining users and profiles
+    location = db.Column(db.String(100))
     creation_date = db.Column(db.DateTime, default=lambda : datetime.now(timezone.utc))
+    # Bumped by every change that shows in the post's JSON, the ETags of posts and pages derive from it
+    updated_at = db.Column(VersionStamp, default=lambda : datetime.now(timezone.utc),
+                           onupdate=lambda : datetime.now(timezone.utc))
+    # Filled only by queries that ask for it with with_expression(), see post_service.with_post_relations
+    summary = db.query_expression()
+    images = db.relationship('PostImage', backref='post', order_by='PostImage.position',
+                             cascade='all, delete-orphan')
+
+
+class PostImage(db.Model):
+    __tablename__ = 'post_images'
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'position', name='uq_post_images_post_position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+
+    position = db.Column(db.Integer, nullable=False)
+    # Relative path of the stored object when object_id is set, a name inside Post.img_path for older uploads
+    filename = db.Column(db.String(255), nullable=False)
+    has_variants = db.Column(db.Boolean, nullable=False, default=False)
+    object_id = db.Column(db.Integer, db.ForeignKey('stored_objects.id'), index=True)
+
+    @property
+    def path(self):
+        if self.object_id is not None:
+            return self.filename
+        return os.path.join(self.post.img_path, self.filename)
+
+
+class StoredObject(db.Model):
+    __tablename__ = 'stored_objects'
+    __table_args__ = (
+        db.Index('ix_stored_objects_refcount_released_at', 'refcount', 'released_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), nullable=False, unique=True)
+    ext = db.Column(db.String(8), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    released_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda : datetime.now(timezone.utc))
+
+    @staticmethod
+    def path_for(digest, ext):
+        return os.path.join('uploads', 'objects', digest[:2], digest[2:4], digest + ext)
+
+    @property
+    def path(self):
+        return self.path_for(self.digest, self.ext)
 
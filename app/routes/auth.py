@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from ..extensions import db, jwt
 from ..models import User, Profile
-from werkzeug.security import generate_password_hash, check_password_hash
+from ..services.passwords import password_hasher, HashPoolBusy
 from flask_jwt_extended import current_user, create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from datetime import timedelta
 
@@ -9,6 +9,12 @@ from datetime import timedelta
 auth_bp = Blueprint('auth', __name__)
 
 
+def _busy():
+    response = jsonify(msg='Server is busy, try again later')
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     name = request.json.get('name')
@@ -34,7 +40,7 @@ def register():
     try:
         user = User.query.filter_by(email=email).one_or_none()
         if not user:
-            hash_ = generate_password_hash(password)
+            hash_ = password_hasher.hash(password)
             new_user = User(email=email, password=hash_)
             db.session.add(new_user)
             db.session.flush()
@@ -45,6 +51,9 @@ def register():
             return jsonify(msg='User created successfully'), 201
         else:
             return jsonify(msg='A user with this email already exists'), 400
+    except HashPoolBusy:
+        db.session.rollback()
+        return _busy()
     except Exception as e:
         db.session.rollback()
         print(f'Error while registering user: {e}')
@@ -59,12 +68,23 @@ def login():
         return jsonify(msg='Missing password or email field'), 400
 
     user = User.query.filter_by(email=email).one_or_none()
-    if not user or not check_password_hash(user.password, password):
-        return jsonify(msg='Wrong email or password'), 401
-    else:
-        access_token = create_access_token(identity=str(user.id), fresh=True, expires_delta=timedelta(hours=1))
-        refresh_token = create_refresh_token(identity=str(user.id), expires_delta=timedelta(days=7))
-        return jsonify(access_token=access_token, refresh_token=refresh_token, user_id=user.id), 200
+    try:
+        if not user or not password_hasher.verify(user.password, password):
+            return jsonify(msg='Wrong email or password'), 401
+    except HashPoolBusy:
+        return _busy()
+
+    # Stored hashes are upgraded to the configured method and cost while we know the password
+    if password_hasher.needs_rehash(user.password):
+        try:
+            user.password = password_hasher.hash(password)
+            db.session.commit()
+        except HashPoolBusy:
+            db.session.rollback()
+
+    access_token = create_access_token(identity=str(user.id), fresh=True, expires_delta=timedelta(hours=1))
+    refresh_token = create_refresh_token(identity=str(user.id), expires_delta=timedelta(days=7))
+    return jsonify(access_token=access_token, refresh_token=refresh_token, user_id=user.id), 200
 
 
 @auth_bp.route('/refresh', methods=['POST'])
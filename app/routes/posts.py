@@ -1,13 +1,28 @@
-from flask import Blueprint, request, jsonify, send_file
-from ..extensions import db, jwt, ALLOWED_EXTENSIONS
-from ..models import User, Post
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from ..extensions import db
+from ..models import Post, PostImage
 from flask_jwt_extended import jwt_required, current_user
 from werkzeug.utils import secure_filename
-from ..utils.file_load import clear_folder
-from sqlalchemy import or_
+from ..utils.uploads import upload_limits, sniff_extension
+from ..services.post_service import with_post_relations, serialize_post, POST_FIELDS, LIST_FIELDS, POST_SORTS, \
+    DEFAULT_SORT, filter_posts, sort_posts, posts_after, post_cursor, validate_new_post, post_version, page_version, \
+    creator_location, PAGE_FIELDS
+from ..services.search import search_engine
+from ..services.suggest import suggest_index
+from ..services.cache import response_cache
+from ..services.conditional import conditional
+from ..services.image_delivery import serve_upload
+from ..services.thumbnails import derivative_pipeline
+from ..services.reclaim import storage_reclaimer
+from ..services.storage import image_store
+from ..services.bulk_import import bulk_importer
+from ..utils.batch import parse_id_list, InvalidIdList
+from ..utils.fields import parse_fields, InvalidFields
+from ..utils.filters import parse_price, parse_choice, InvalidFilter
+from ..utils.pagination import get_page_size, InvalidCursor
+from sqlalchemy import select, func
 from math import ceil
-import os
-import shutil
+import zipfile
 
 
 posts_bp = Blueprint('posts', __name__)
@@ -15,47 +30,65 @@ posts_bp = Blueprint('posts', __name__)
 MAX_IMAGE_SIZE = (1024 * 1024) * 2
 MAX_IMAGES = 4
 MAX_TOTAL_SIZE = MAX_IMAGE_SIZE * MAX_IMAGES
+MAX_IMPORT_FILE_SIZE = (1024 * 1024) * 256
+IMPORT_FORMATS = {'jsonl': 'jsonl', 'ndjson': 'jsonl', 'csv': 'csv'}
 
 
-@jwt.user_lookup_loader
-def user_lookup_callback(_jwt_header, jwt_data):
-    id = jwt_data["sub"]
-    return User.query.get(id)
+def list_fields():
+    return parse_fields(request.args.get('fields'), POST_FIELDS, LIST_FIELDS)
+
+
+def post_filters():
+    filters = {
+        'min_price': parse_price(request.args.get('min_price'), 'min_price'),
+        'max_price': parse_price(request.args.get('max_price'), 'max_price'),
+        'location': request.args.get('location', '').strip() or None
+    }
+    if filters['min_price'] is not None and filters['max_price'] is not None \
+            and filters['min_price'] > filters['max_price']:
+        raise InvalidFilter('min_price must not be greater than max_price')
+    return {k: v for k, v in filters.items() if v is not None}
+
 
 @posts_bp.route('/create-post', methods=['POST'])
 @jwt_required()
+@upload_limits(MAX_IMAGE_SIZE, MAX_TOTAL_SIZE, MAX_IMAGES)
 def create_post():
     title = request.form.get('title')
     price = request.form.get('price')
     description = request.form.get('description')
 
-    # Basic validation
-    print(title, price, description)
-    if not all([title, price, description]):
-        return jsonify(msg='Missing some fields'), 400
-    elif len(title.strip()) < 4:
-        return jsonify(msg='The title must be at least 5 characters long'), 400
-    elif len(description.strip()) < 10:
-        return jsonify(msg='The description must be at least 10 characters long'), 400
+    price, error = validate_new_post(title, price, description)
+    if error:
+        return jsonify(msg=error), 400
 
-    # Individual price validation
-    try:
-        price = float(price)
-        if price <= 0:
-            return jsonify(msg='The price must be positive'), 400
-    except ValueError:
-        return jsonify(msg='Invalid price format'), 400
+    # Files are already in the staging folder, per-file and total limits were enforced while they streamed in
+    staged_files = []
+    total_size = 0
+    for img in request.files.getlist('files')[:MAX_IMAGES]:
+        if img and img.filename:
+            ext = sniff_extension(img.stream.head())
+            if ext is None:
+                return jsonify(msg=f'Unsupported file type: {secure_filename(img.filename)}'), 400
+            staged_files.append((img.stream, ext))
+            total_size += img.stream.size
 
-    # Creating new post
+    if total_size > MAX_TOTAL_SIZE:
+        return jsonify(msg=f'Total size of images exceeds {MAX_TOTAL_SIZE / (1024*1024)} MB'), 400
+
+    # Creating new post, images go into the object store inside the same transaction.
+    # Objects stored by a failed attempt have no references and are collected by the sweeper
+    saved_files = []
     try:
-        new_post = Post(title=title, price=price, description=description, creator_id=current_user.id)
+        new_post = Post(title=title, price=price, description=description, creator_id=current_user.id,
+                        location=creator_location(current_user.id))
         db.session.add(new_post)
         db.session.flush()
 
-        # Defining the post directory
-        path = os.path.join('uploads', 'posts', str(new_post.id))
-        os.makedirs(path, exist_ok=True)
-        new_post.img_path = path
+        for idx, (staged, ext) in enumerate(staged_files, start=1):
+            obj = image_store.put_staged(staged, ext)
+            saved_files.append(obj.path)
+            db.session.add(PostImage(post_id=new_post.id, position=idx, filename=obj.path, object_id=obj.id))
 
         db.session.commit()
     except Exception as e:
@@ -63,37 +96,11 @@ def create_post():
         print(f'Error creating post: {e}')
         return jsonify(msg='Error creating post'), 500
 
-    saved_files = []
-    images = request.files.getlist('files')[:MAX_IMAGES]
-    total_size = 0
-
-    for idx, img in enumerate(images, start=1):
-        if img and img.filename:
-            filename = secure_filename(img.filename)
-            ext = os.path.splitext(filename)[1].lower()
-
-            img.seek(0, os.SEEK_END)
-            size_bytes = img.tell()
-            img.seek(0)
-
-            if ext not in ALLOWED_EXTENSIONS:
-                clear_folder(path)
-                return jsonify(msg=f'Unsupported file extension: {ext}'), 400
-            if size_bytes > MAX_IMAGE_SIZE:
-                clear_folder(path)
-                return jsonify(msg=f'File {filename} exceeds {MAX_IMAGE_SIZE / (1024*1024)} MB'), 400
-
-            saved_name = f"post_image{idx}{ext}"
-            saved_path = os.path.join(path, saved_name)
-            img.save(saved_path)
-            saved_files.append(saved_name)
-            total_size += size_bytes
-
-    if total_size > MAX_TOTAL_SIZE:
-        clear_folder(path)
-        return jsonify(msg=f'Total size of images exceeds {MAX_TOTAL_SIZE / (1024*1024)} MB'), 400
-
-    db.session.commit()
+    search_engine.index_post(new_post)
+    suggest_index.update(new_title=title)
+    response_cache.invalidate_namespace('feed')
+    if saved_files:
+        derivative_pipeline.submit_post(new_post.id)
     return jsonify(
         msg='Post created successfully',
         post_id=new_post.id,
@@ -101,11 +108,73 @@ def create_post():
     ), 201
 
 
+@posts_bp.route('/import', methods=['POST'])
+@jwt_required()
+@upload_limits(MAX_IMPORT_FILE_SIZE, MAX_IMPORT_FILE_SIZE, 2)
+def import_posts():
+    # Both parts are staged to disk while they stream in, rows are then read from there line by line
+    rows = request.files.get('rows')
+    archive = request.files.get('images')
+    if not rows or not rows.filename:
+        return jsonify(msg='rows file is required'), 400
+
+    fmt = IMPORT_FORMATS.get((request.form.get('format') or rows.filename.rsplit('.', 1)[-1]).lower())
+    if fmt is None:
+        return jsonify(msg='rows must be a .jsonl or .csv file'), 400
+    archive_path = None
+    if archive and archive.filename:
+        if not zipfile.is_zipfile(archive.stream.path):
+            return jsonify(msg='images must be a zip archive'), 400
+        archive_path = archive.stream.path
+
+    results = bulk_importer.run(current_user._get_current_object(), rows.stream.path, fmt, archive_path, MAX_IMAGES, MAX_IMAGE_SIZE)
+    return Response(stream_with_context(results), mimetype='application/x-ndjson')
+
+
+@posts_bp.route('/feed')
+@response_cache.cached('feed', versioned=True)
+def get_feed():
+    per_page = get_page_size(request.args.get('limit'),
+                             current_app.config['POSTS_PER_PAGE'],
+                             current_app.config['POSTS_MAX_PAGE_SIZE'])
+    try:
+        fields = list_fields()
+        filters = post_filters()
+        sort = parse_choice(request.args.get('sort'), tuple(POST_SORTS), 'sort', DEFAULT_SORT)
+    except (InvalidFields, InvalidFilter) as e:
+        return jsonify(msg=str(e)), 400
+    query = sort_posts(filter_posts(with_post_relations(Post.query, fields), sort=sort, **filters), sort)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            query = posts_after(query, cursor, sort)
+        except InvalidCursor:
+            return jsonify(msg='Invalid cursor'), 400
+
+    # Fetching one extra row tells whether there is a next page without a count()
+    posts = query.limit(per_page + 1).all()
+    has_more = len(posts) > per_page
+    posts = posts[:per_page]
+
+    next_cursor = post_cursor(posts[-1], sort) if has_more else None
+    return jsonify(posts=[serialize_post(p, fields) for p in posts], next_cursor=next_cursor)
+
 @posts_bp.route('/page/<int:page>')
+@conditional(page_version)
+@response_cache.cached('feed', versioned=True)
 def get_posts(page):
+    # Compatibility shim for numbered pages, new clients should use /feed. The trimmed card fields
+    # are opt-in here through fields=
+    per_page = current_app.config['POSTS_PER_PAGE']
+    try:
+        fields = parse_fields(request.args.get('fields'), POST_FIELDS, PAGE_FIELDS)
+    except InvalidFields as e:
+        return jsonify(msg=str(e)), 400
+
     posts = []
     try:
-        posts = Post.query.order_by(Post.creation_date.desc()).offset((page-1) * 10).limit(10).all()
+        posts = sort_posts(with_post_relations(Post.query, fields)).offset((page-1) * per_page).limit(per_page).all()
     except Exception as e:
         print(f'Error while getting posts: {e}')
 
@@ -113,87 +182,94 @@ def get_posts(page):
         return jsonify(msg='No posts on this page'), 400
 
     response = []
-
     for p in posts:
-        data = {'id': p.id,
-                     'title': p.title,
-                     'price': p.price,
-                     'location': p.creator.profile.location,
-                     'time':  p.creation_date,
-                     'page': page,
-                     'description': p.description
-                     }
-        image = os.listdir(p.img_path)
-
-        if image:
-            data.update({'image': os.path.join(p.img_path, os.listdir(p.img_path)[0])})
-        else:
-            data.update({'image': None})
-
+        data = serialize_post(p, fields)
+        data['page'] = page
         response.append(data)
 
-    return jsonify(response)
+    resp = jsonify(response)
+    if len(posts) == per_page:
+        resp.headers['X-Next-Cursor'] = post_cursor(posts[-1])
+    return resp
 
 @posts_bp.route('/<int:id>')
+@conditional(post_version)
+@response_cache.cached('post')
 def get_post_by_id(id):
-    post = Post.query.filter_by(id=id).one_or_none()
+    post = with_post_relations(Post.query).filter_by(id=id).one_or_none()
 
     if not post:
         return jsonify(msg='Post with this id does not exists'), 400
 
-    path = post.img_path
-    images = [os.path.join(path, f) for f in os.listdir(path) if f[f.rfind('.'):] in ALLOWED_EXTENSIONS]
+    return jsonify(post=serialize_post(post))
+
+@posts_bp.route('/batch')
+def get_posts_batch():
+    try:
+        ids = parse_id_list(request.args.get('ids'), current_app.config['BATCH_MAX_IDS'])
+        fields = list_fields()
+    except (InvalidIdList, InvalidFields) as e:
+        return jsonify(msg=str(e)), 400
 
-    return jsonify(post={
-        'id': post.id,
-        'creator_id': post.creator.id,
-        'title': post.title,
-        'description': post.description,
-        'price': post.price,
-        'time': post.creation_date,
-        'img_path': images
-    })
+    found = {p.id: p for p in with_post_relations(Post.query, fields).filter(Post.id.in_(ids))}
+    return jsonify(
+        posts=[serialize_post(found[id], fields) for id in ids if id in found],
+        missing=[id for id in ids if id not in found]
+    )
+
+@posts_bp.route('/suggest')
+def suggest():
+    # Called on every keystroke, answered from memory without touching the database
+    limit = get_page_size(request.args.get('limit'),
+                          current_app.config['SUGGEST_LIMIT'],
+                          current_app.config['SUGGEST_MAX_LIMIT'])
+    suggestions = suggest_index.suggest(request.args.get('q', ''), limit)
+    return jsonify(suggestions=[{'text': text, 'count': count} for text, count in suggestions])
 
 @posts_bp.route('/search/<string:search_word>/<int:page>')
 def get_searched_posts(search_word, page):
     words = tuple(map(str.strip, search_word.split()))
     if not words:
         return jsonify({"msg": "search data can't be empty"}), 400
+    try:
+        fields = list_fields()
+        filters = post_filters()
+        sort = parse_choice(request.args.get('sort'), ('relevance',) + tuple(POST_SORTS), 'sort', 'relevance')
+    except (InvalidFields, InvalidFilter) as e:
+        return jsonify(msg=str(e)), 400
+
+    per_page = current_app.config['POSTS_PER_PAGE']
+    offset = (page - 1) * per_page
+    if not filters and sort == 'relevance':
+        ids, total, capped = search_engine.search(' '.join(words), offset, per_page)
+    else:
+        # Filters and other orders apply to the capped set of matches, narrowed down in the database
+        matches, _, capped = search_engine.search(' '.join(words), 0, search_engine.total_cap)
+        query = filter_posts(select(Post.id).where(Post.id.in_(matches)), **filters) if matches else None
+        if query is None:
+            ids, total = [], 0
+        elif sort == 'relevance':
+            found = set(db.session.scalars(query))
+            ids = [post_id for post_id in matches if post_id in found]
+            total, ids = len(ids), ids[offset:offset + per_page]
+        else:
+            total = db.session.scalar(select(func.count()).select_from(query.subquery()))
+            ids = db.session.scalars(sort_posts(query, sort).offset(offset).limit(per_page)).all()
+    total_pages = ceil(total / per_page)
 
-    query = Post.query.filter(
-        or_(*(Post.title.ilike(f"%{kw}%") for kw in words))
-    ).order_by(Post.creation_date.desc())
-
-    total_pages = ceil(query.count() / 10)
-    posts = query.offset((page - 1) * 10).limit(10).all()
+    posts = with_post_relations(Post.query, fields).filter(Post.id.in_(ids)).all() if ids else []
+    posts.sort(key=lambda p: ids.index(p.id))
 
-    res = [{
-        'id': p.id,
-        'title': p.title,
-        'time': p.creation_date,
-        'location': p.creator.profile.location,
-        'creator_id': p.creator_id,
-        'price': float(p.price),
-        'img_path': [os.path.join(p.img_path, f) for f in os.listdir(p.img_path) if f[f.rfind('.'):] in ALLOWED_EXTENSIONS],
-        'description': p.description
-    } for p in posts]
+    res = [serialize_post(p, fields) for p in posts]
 
     if not res:
         return jsonify(msg='No post on this search'), 400
 
-    return jsonify(total_pages=total_pages, posts=res)
+    return jsonify(total_pages=total_pages, total_capped=capped, posts=res)
 
 @posts_bp.route('/get-image/<path:f_path>')
 def get_image(f_path: str):
-    if not f_path.startswith(('uploads/', 'uploads\\')):
-        return jsonify(msg='Wrong directory'), 404
-
-    full_path = os.path.join(os.getcwd(), f_path)
-
-    if os.path.isfile(full_path):
-        return send_file(full_path)
-
-    return jsonify(msg='File not found'), 404
+    return serve_upload(f_path)
 
 @posts_bp.route('/edit-post/<int:post_id>', methods=['PUT'])
 @jwt_required()
@@ -207,6 +283,7 @@ def edit_post(post_id):
 
     fields = ('title', 'price', 'description')
     errors = {}
+    old_title = current_post.title
     for k in fields:
         if k in data:
             value = data[k]
@@ -230,6 +307,10 @@ def edit_post(post_id):
         return jsonify(errors=errors), 400
 
     db.session.commit()
+    search_engine.index_post(current_post)
+    suggest_index.update(old_title, current_post.title)
+    response_cache.invalidate('post', current_post.id)
+    response_cache.invalidate_namespace('feed')
     return jsonify(msg="Post updated successfully", post_id=current_post.id)
 
 @posts_bp.route('/delete/<int:post_id>', methods=['DELETE'])
@@ -240,15 +321,17 @@ def delete_post(post_id):
         return jsonify(msg='Post not found'), 404
 
     response = dict()
-    if os.path.isdir(post.img_path):
-        try:
-            shutil.rmtree(post.img_path)
-            response.update({'removed_directory': post.img_path})
-        except Exception as e:
-            print(f'Error while deleting post {post.id}: {e}')
-
+    image_store.release(*(image.object_id for image in post.images))
     db.session.delete(post)
     db.session.commit()
+    if post.img_path:
+        # Uploads from before the object store live in a directory of their own
+        storage_reclaimer.remove(post.img_path)
+        response.update({'removed_directory': post.img_path})
+    search_engine.remove_post(post.id)
+    suggest_index.update(old_title=post.title)
+    response_cache.invalidate('post', post.id)
+    response_cache.invalidate_namespace('feed')
     response.update({'deleted_post_id': post.id})
 
     return jsonify(**response), 200
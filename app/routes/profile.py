@@ -1,11 +1,25 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, current_app
 from ..extensions import jwt, db
-from ..models import User, Profile
+from ..models import Profile, Post
+from ..services.cache import response_cache
+from ..services.profile_service import with_user, serialize_profile, profile_version
+from ..services.conditional import conditional
+from ..services.post_service import seller_inventory, seller_stats, serialize_post, post_cursor, INVENTORY_FIELDS
+from ..services.image_delivery import serve_upload
+from ..services.thumbnails import derivative_pipeline, derivative_path
+from ..services.reclaim import storage_reclaimer
+from ..services.storage import image_store
+from ..services.search import search_engine
+from ..services.suggest import suggest_index
 from flask_jwt_extended import jwt_required, current_user, get_jwt
-from  ..extensions import ALLOWED_EXTENSIONS, redis_blocklist
-import os
-from werkzeug.utils import secure_filename
+from ..services.revocation import revocation_cache
+from ..services.identity import identity_cache
+from ..utils.uploads import upload_limits, sniff_extension
+from ..utils.batch import parse_id_list, InvalidIdList
+from ..utils.pagination import get_page_size, InvalidCursor
+from datetime import datetime, timezone
 import json
+import time
 
 
 profile_bp = Blueprint('profile', __name__)
@@ -14,13 +28,16 @@ MAX_IMAGE_SIZE = (1024 * 1024) * 4
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload["jti"]
-    return redis_blocklist.get(jti) is not None
+    return revocation_cache.is_revoked(jwt_payload["jti"])
 
-@jwt.user_lookup_loader
-def user_lookup_callback(_jwt_header, jwt_data):
-    id = jwt_data["sub"]
-    return User.query.get(id)
+def _invalidate_cached_user(user_id, with_posts=False):
+    identity_cache.invalidate(user_id)
+    response_cache.invalidate('profile', user_id)
+    if with_posts:
+        # Post cards and details show the seller's location
+        post_ids = [post_id for post_id, in db.session.query(Post.id).filter_by(creator_id=user_id)]
+        response_cache.invalidate('post', *post_ids)
+        response_cache.invalidate_namespace('feed')
 
 @profile_bp.route('/my-profile')
 @jwt_required()
@@ -34,75 +51,91 @@ def my_profile():
         'phone_number': pr.phone_number,
         'location': pr.location,
         'img_path': pr.img_path,
+        'ava_thumb': derivative_path(pr.img_path, 'thumb') if pr.ava_variants else pr.img_path,
         'user_id': pr.user_id,
         'email': current_user.email,
         'reg_time': current_user.reg_datetime,
-        'posts_id': [p.id for p in current_user.posts]
+        'posts': seller_stats(current_user.id)
     }), 200
 
 @profile_bp.route('/<int:id>')
+@conditional(profile_version)
+@response_cache.cached('profile')
 def profile(id):
-    pr = Profile.query.filter_by(user_id=id).one_or_none()
+    pr = with_user(Profile.query).filter_by(user_id=id).one_or_none()
     if not pr:
         return jsonify(msg='User does not exists'), 400
 
-    return jsonify(profile={
-        'name': pr.name,
-        'surname': pr.surname,
-        'age': pr.age,
-        'bio': pr.bio,
-        'phone_number': pr.phone_number,
-        'location': pr.location,
-        'img_path': pr.img_path,
-        'user_id': pr.user_id,
-        'email': pr.user.email,
-        'reg_time': pr.user.reg_datetime
-    }), 200
+    return jsonify(profile=serialize_profile(pr)), 200
+
+@profile_bp.route('/<int:id>/posts')
+@response_cache.cached('feed', versioned=True)
+def inventory(id):
+    # Kept with the feed, every post change already drops that namespace
+    per_page = get_page_size(request.args.get('limit'),
+                             current_app.config['POSTS_PER_PAGE'],
+                             current_app.config['POSTS_MAX_PAGE_SIZE'])
+    try:
+        query = seller_inventory(id, request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify(msg='Invalid cursor'), 400
+
+    posts = query.limit(per_page + 1).all()
+    has_more = len(posts) > per_page
+    posts = posts[:per_page]
+
+    next_cursor = post_cursor(posts[-1]) if has_more else None
+    return jsonify(posts=[serialize_post(p, INVENTORY_FIELDS) for p in posts], next_cursor=next_cursor)
+
+@profile_bp.route('/batch')
+def profiles_batch():
+    try:
+        ids = parse_id_list(request.args.get('ids'), current_app.config['BATCH_MAX_IDS'])
+    except InvalidIdList as e:
+        return jsonify(msg=str(e)), 400
+
+    found = {pr.user_id: pr for pr in with_user(Profile.query).filter(Profile.user_id.in_(ids))}
+    return jsonify(
+        profiles=[serialize_profile(found[id]) for id in ids if id in found],
+        missing=[id for id in ids if id not in found]
+    ), 200
 
 @profile_bp.route('/my-profile/upload-ava', methods=['POST'])
 @jwt_required()
+@upload_limits(MAX_IMAGE_SIZE, MAX_IMAGE_SIZE, 1)
 def upload_ava():
-    image = request.files.getlist('ava')[0]
-    print(image.filename)
+    images = request.files.getlist('ava')
 
-    if len(request.files.getlist('ava')) != 1:
+    if len(images) != 1:
         return jsonify(msg='Only 1 image needed'), 400
+    image = images[0]
     if not image or not image.filename:
         return jsonify(msg='No image passed or wrong filename')
 
-    ext = os.path.splitext(secure_filename(image.filename))[1].lower()
-
-    if ext not in ALLOWED_EXTENSIONS:
-        return jsonify(msg='Unsupported file extension'), 400
-
-    image.seek(0, os.SEEK_END)
-    size_bytes = image.tell()
-    image.seek(0)
-    if size_bytes > MAX_IMAGE_SIZE:
-        return jsonify(msg=f'File {image.filename} exceeds {MAX_IMAGE_SIZE / (1024*1024)} MB'), 400
+    # The file is already staged and within MAX_IMAGE_SIZE, only its real type is left to check
+    ext = sniff_extension(image.stream.head())
+    if ext is None:
+        return jsonify(msg='Unsupported file type'), 400
 
-    prev_path = current_user.profile.img_path
-    if prev_path and os.path.isfile(os.path.join(os.getcwd(), prev_path)):
-        os.remove(prev_path)
+    user_profile = current_user.load().profile
+    prev_path, prev_object_id = user_profile.img_path, user_profile.ava_object_id
 
-    path = os.path.join('uploads', 'avas', f'{current_user.id}_ava{ext}')
-
-    image.save(os.path.join(os.getcwd(), path))
-    current_user.profile.img_path = path
+    obj = image_store.put_staged(image.stream, ext)
+    image_store.release(prev_object_id)
+    user_profile.img_path = obj.path
+    user_profile.ava_object_id = obj.id
+    user_profile.ava_variants = False
     db.session.commit()
+    if prev_path and prev_object_id is None:
+        # Avatars from before the object store were stored under a fixed name
+        storage_reclaimer.remove_avatar(prev_path)
+    _invalidate_cached_user(current_user.id)
+    derivative_pipeline.submit_avatar(current_user.id)
     return jsonify(msg='Ava uploaded successfully'), 200
 
 @profile_bp.route('/get-image/<path:f_path>')
 def get_image(f_path: str):
-    if not f_path.startswith(('uploads/', 'uploads\\')):
-        return jsonify(msg='Wrong directory'), 404
-
-    full_path = os.path.join(os.getcwd(), f_path)
-
-    if os.path.isfile(full_path):
-        return send_file(full_path)
-
-    return jsonify(msg='File not found'), 404
+    return serve_upload(f_path)
 
 @profile_bp.route('/my-profile/set-data', methods=['PUT'])
 @jwt_required()
@@ -115,6 +148,7 @@ def change_profile_data():
     errors = {}
 
     try:
+        user_profile = current_user.load().profile
         for key in allowed_fields:
             if key in data and data[key] != 'null':
                 value = data[key]
@@ -132,14 +166,20 @@ def change_profile_data():
                     errors[key] = 'Invalid phone number'
 
                 if key not in errors:
-                    setattr(current_user.profile, key, value)
+                    setattr(user_profile, key, value)
 
         print(errors)
         if errors:
             db.session.rollback()
             return jsonify(errors=errors), 400
 
+        if 'location' in data:
+            # Posts carry a copy of the location for the feed filters
+            Post.query.filter_by(creator_id=current_user.id).update(
+                {'location': user_profile.location, 'updated_at': datetime.now(timezone.utc)},
+                synchronize_session=False)
         db.session.commit()
+        _invalidate_cached_user(current_user.id, with_posts='location' in data)
         return jsonify(msg='Profile updated successfully')
 
     except Exception as e:
@@ -150,9 +190,28 @@ def change_profile_data():
 @profile_bp.route('/delete-profile', methods=['DELETE'])
 @jwt_required(fresh=True)
 def delete_profile():
-    identity = get_jwt()["jti"]
-    redis_blocklist.set(identity, "revoked", ex=3600)
+    token = get_jwt()
+    revocation_cache.revoke(token["jti"], max(token["exp"] - time.time(), 0))
+
+    user_id = current_user.id
+    user = current_user.load()
+    posts = db.session.query(Post.id, Post.img_path, Post.title).filter_by(creator_id=user_id).all()
+    post_ids = [post_id for post_id, _, _ in posts]
+    profile = user.profile
 
-    db.session.delete(current_user)
+    image_store.release(*image_store.post_object_ids(post_ids), profile.ava_object_id if profile else None)
+    db.session.delete(user)
     db.session.commit()
+    # Uploads from before the object store are not reference counted and are removed directly
+    storage_reclaimer.remove(*(img_path for _, img_path, _ in posts))
+    if profile and profile.ava_object_id is None:
+        storage_reclaimer.remove_avatar(profile.img_path)
+    identity_cache.invalidate(user_id)
+    response_cache.invalidate('profile', user_id)
+    for post_id in post_ids:
+        search_engine.remove_post(post_id)
+    for _, _, title in posts:
+        suggest_index.update(old_title=title)
+    response_cache.invalidate('post', *post_ids)
+    response_cache.invalidate_namespace('feed')
     return jsonify(msg="Your account has been deleted."), 200
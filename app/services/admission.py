@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from flask import g, request, jsonify
+from redis.exceptions import RedisError
+from ..extensions import redis_client
+from .metrics import metrics
+from .slots import RedisSlots, LocalSlots
+import math
+import threading
+import time
+
+
+# KEYS[1] bucket hash, ARGV rate, burst, now. Returns {1, 0} when admitted, {0, seconds to wait} otherwise
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+if wait > 0 then
+    return {0, wait}
+end
+return {1, 0}
+"""
+
+class CostClass:
+    def __init__(self, name, rate, burst, concurrency, slot_lease, lock_dir):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.local_slots = LocalSlots(lock_dir, name, concurrency)
+        self.redis_slots = RedisSlots(f'admission:slots:{name}', concurrency, slot_lease)
+
+
+class AdmissionControl:
+    """Sheds requests to expensive endpoints before they can occupy every worker.
+
+    ADMISSION_ROUTES maps endpoints to the cost classes of ADMISSION_CLASSES, endpoints without one
+    or with a class that is not configured are never limited. Each client gets a token bucket per
+    class refilled at rate per second up to burst, an empty bucket answers 429. Buckets live in the
+    worker unless ADMISSION_SYNC is 'redis', then every worker and host draws from the same bucket.
+
+    At most concurrency requests of a class run at once, the rest get 503. Slots are lock files in
+    ADMISSION_LOCK_DIR shared by the workers of a host, with ADMISSION_SYNC = 'redis' members of a
+    Redis sorted set shared by every host, where one left behind by a killed worker expires after
+    ADMISSION_SLOT_LEASE_SECONDS. Slots are released on teardown. Redis failures fall back to the
+    local bucket and slots. Both rejections carry Retry-After.
+    """
+
+    def __init__(self):
+        self.classes = {}
+        self.routes = {}
+        self.sync = 'local'
+        self.trusted_proxies = 0
+        self.max_clients = 10000
+        self.busy_retry_after = 1
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._bucket_script = None
+
+    def init_app(self, app):
+        self.classes = {name: CostClass(name, slot_lease=app.config['ADMISSION_SLOT_LEASE_SECONDS'],
+                                        lock_dir=app.config['ADMISSION_LOCK_DIR'], **limits)
+                        for name, limits in app.config['ADMISSION_CLASSES'].items()}
+        self.routes = app.config['ADMISSION_ROUTES']
+        self.sync = app.config['ADMISSION_SYNC']
+        self.trusted_proxies = app.config['ADMISSION_TRUSTED_PROXIES']
+        self.max_clients = app.config['ADMISSION_MAX_CLIENTS']
+        self.busy_retry_after = app.config['ADMISSION_BUSY_RETRY_AFTER']
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _client(self):
+        if self.trusted_proxies:
+            # The address our own proxies saw, anything further left is up to the client
+            header = request.headers.get('X-Forwarded-For', '')
+            forwarded = [addr.strip() for addr in header.split(',') if addr.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return request.remote_addr or '-'
+
+    def _take_local(self, cost_class, client):
+        now = time.monotonic()
+        key = (cost_class.name, client)
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (cost_class.burst, now))
+            tokens = min(cost_class.burst, tokens + (now - last) * cost_class.rate)
+            wait = 0 if tokens >= 1 else math.ceil((1 - tokens) / cost_class.rate)
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            # Forgetting the least recent client only hands it a full bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def _take_redis(self, cost_class, client):
+        if self._bucket_script is None:
+            self._bucket_script = redis_client.client.register_script(TOKEN_BUCKET_SCRIPT)
+        admitted, wait = self._bucket_script(keys=[f'admission:{cost_class.name}:{client}'],
+                                             args=[cost_class.rate, cost_class.burst, time.time()])
+        return 0 if admitted else int(wait)
+
+    def _take(self, cost_class, client):
+        if self.sync == 'redis':
+            try:
+                return self._take_redis(cost_class, client)
+            except RedisError as e:
+                print(f'Error while taking an admission token from Redis: {e}')
+        return self._take_local(cost_class, client)
+
+    def _reject(self, cost_class, status, retry_after, reason):
+        metrics.registry.inc('admission_rejected_total', {'class': cost_class.name, 'reason': reason})
+        msg = 'Too many requests, try again later' if status == 429 else 'Server is busy, try again later'
+        response = jsonify(msg=msg)
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def _before_request(self):
+        cost_class = self.classes.get(self.routes.get(request.endpoint))
+        if cost_class is None or request.method == 'OPTIONS':
+            return None
+        wait = self._take(cost_class, self._client())
+        if wait:
+            return self._reject(cost_class, 429, wait, 'rate')
+        slots = cost_class.redis_slots if self.sync == 'redis' else cost_class.local_slots
+        admitted, token = slots.acquire()
+        if admitted and token is None:
+            # Redis could not tell, the host's own slots still bound the class
+            slots = cost_class.local_slots
+            admitted, token = slots.acquire()
+        if not admitted:
+            return self._reject(cost_class, 503, self.busy_retry_after, 'concurrency')
+        # Released on teardown, which for streamed responses comes after the last chunk
+        g.admission_slot = (slots, token)
+        return None
+
+    def _teardown_request(self, exc):
+        slot = g.pop('admission_slot', None)
+        if slot is None:
+            return
+        slots, token = slot
+        slots.release(token)
+
+
+admission_control = AdmissionControl()
@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import insert
+from ..extensions import db
+from ..models import Post, PostImage
+from ..utils.uploads import sniff_extension
+from .post_service import validate_new_post, creator_location
+from .search import search_engine
+from .suggest import suggest_index
+from .cache import response_cache
+from .storage import image_store
+from .thumbnails import derivative_pipeline
+import csv
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import zipfile
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt):
+    """Yields (row number, fields or RowError) one line at a time, the file is never loaded whole."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                images = row.get('images') or ''
+                row['images'] = [name.strip() for name in images.split('|') if name.strip()]
+                yield number, row
+            return
+
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, RowError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(row, dict):
+                yield number, RowError('Each line must be a JSON object')
+                continue
+            images = row.get('images') or []
+            if not isinstance(images, list) or not all(isinstance(name, str) for name in images):
+                yield number, RowError('images must be a list of file names')
+                continue
+            row['images'] = images
+            yield number, row
+
+
+class BulkImporter:
+    """Creates posts from a JSONL or CSV file and an optional zip of their images.
+
+    Rows are read as a stream and committed IMPORT_CHUNK_SIZE at a time. Each post is its own
+    INSERT so its id comes back with it, the image rows of a chunk are sent as one executemany
+    INSERT. Claiming a stored object still costs an UPDATE and a SELECT per image, or a savepoint
+    and INSERT for new bytes. Images of a chunk are unpacked, sniffed and hashed on a
+    thread pool while the database work stays on the request thread, so memory use is bounded by
+    the chunk size.
+    """
+
+    def __init__(self):
+        self.chunk_size = 200
+        self.max_rows = 5000
+        self._workers = 4
+        self._executor = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.chunk_size = app.config['IMPORT_CHUNK_SIZE']
+        self.max_rows = app.config['IMPORT_MAX_ROWS']
+        self._workers = app.config['IMPORT_IMAGE_WORKERS']
+
+    def _get_executor(self):
+        # gunicorn forks workers after import, each one needs its own threads
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='import')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _extract(self, archive, name, staging_folder, max_size):
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            raise RowError(f'{name} is not in the archive')
+        if info.file_size > max_size:
+            raise RowError(f'{name} exceeds {max_size / (1024*1024)} MB')
+
+        digest = hashlib.sha256()
+        size = 0
+        with archive.open(info) as src, \
+                tempfile.NamedTemporaryFile(dir=staging_folder, prefix='import-', delete=False) as dst:
+            try:
+                # The declared size can lie, the limit is enforced on what actually comes out
+                while chunk := src.read(64 * 1024):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise RowError(f'{name} exceeds {max_size / (1024*1024)} MB')
+                    digest.update(chunk)
+                    dst.write(chunk)
+                dst.seek(0)
+                ext = sniff_extension(dst.read(12))
+                if ext is None:
+                    raise RowError(f'Unsupported file type: {name}')
+            except Exception:
+                os.remove(dst.name)
+                raise
+        return dst.name, digest.hexdigest(), size, ext
+
+    def _extract_group(self, archive_path, names, staging_folder, max_size):
+        # ZipFile handles are not shared between threads, each job opens the archive once for its share
+        results = {}
+        with zipfile.ZipFile(archive_path) as archive:
+            for name in names:
+                try:
+                    results[name] = self._extract(archive, name, staging_folder, max_size)
+                except RowError as e:
+                    results[name] = e
+                except Exception as e:
+                    print(f'Error while extracting {name}: {e}')
+                    results[name] = RowError(f'Could not read {name}')
+        return results
+
+    def _extract_images(self, names, archive_path, max_size):
+        """Returns {name: (temp path, digest, size, ext) or RowError} for the images of one chunk."""
+        staging_folder = current_app.config['UPLOAD_STAGING_FOLDER']
+        names = sorted(names)
+        futures = [self._get_executor().submit(self._extract_group, archive_path, names[i::self._workers],
+                                               staging_folder, max_size)
+                   for i in range(min(self._workers, len(names)))]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def _validate(self, row, max_images, has_archive):
+        if isinstance(row, RowError):
+            raise row
+        price, error = validate_new_post(row.get('title'), row.get('price'), row.get('description'))
+        if error:
+            raise RowError(error)
+        images = row['images']
+        if images and not has_archive:
+            raise RowError('images are listed but no archive was uploaded')
+        if len(images) > max_images:
+            raise RowError(f'At most {max_images} images per post')
+        return {'title': row['title'], 'description': row['description'], 'price': price, 'images': images}
+
+    def _insert_posts(self, user, rows):
+        """Inserts the posts of a chunk and returns their ids in row order."""
+        # A statement per row, MySQL reports only the first id of a multi-row insert and concurrent
+        # inserts may interleave with its range
+        return [
+            db.session.execute(insert(Post).values(
+                title=fields['title'], price=fields['price'], description=fields['description'],
+                creator_id=user.id, location=creator_location(user.id)
+            )).inserted_primary_key[0]
+            for fields in rows
+        ]
+
+    def _import_chunk(self, chunk, user, archive_path, max_images, max_image_size):
+        results = {}
+        valid = []
+        for number, row in chunk:
+            try:
+                valid.append((number, self._validate(row, max_images, archive_path is not None)))
+            except RowError as e:
+                results[number] = {'row': number, 'status': 'error', 'msg': str(e)}
+
+        names = {name for _, fields in valid for name in fields['images']}
+        extracted = self._extract_images(names, archive_path, max_image_size) if names else {}
+        rows = []
+        for number, fields in valid:
+            failed = [extracted[name] for name in fields['images'] if isinstance(extracted[name], RowError)]
+            if failed:
+                results[number] = {'row': number, 'status': 'error', 'msg': str(failed[0])}
+            else:
+                rows.append((number, fields))
+
+        created = []
+        try:
+            post_ids = self._insert_posts(user, [fields for _, fields in rows]) if rows else []
+
+            images = []
+            for (number, fields), post_id in zip(rows, post_ids):
+                for position, name in enumerate(fields['images'], start=1):
+                    path, digest, size, ext = extracted[name]
+                    # Repeated names and already stored bytes only add a reference, the file moves once
+                    obj, _ = image_store.put(digest, ext, size, lambda target: os.replace(path, target))
+                    images.append({'post_id': post_id, 'position': position, 'filename': obj.path,
+                                   'object_id': obj.id})
+                created.append((number, SimpleNamespace(id=post_id, title=fields['title'],
+                                                        description=fields['description'],
+                                                        has_images=bool(fields['images']))))
+            if images:
+                db.session.execute(insert(PostImage), images)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f'Error while importing rows {rows[0][0] if rows else "-"}..: {e}')
+            created = []
+            for number, _ in rows:
+                results[number] = {'row': number, 'status': 'error', 'msg': 'Error creating post'}
+        finally:
+            for value in extracted.values():
+                if not isinstance(value, RowError) and os.path.exists(value[0]):
+                    os.remove(value[0])
+
+        for number, post in created:
+            search_engine.index_post(post)
+            suggest_index.update(new_title=post.title)
+            results[number] = {'row': number, 'status': 'created', 'post_id': post.id}
+        if created:
+            response_cache.invalidate_namespace('feed')
+            with_images = [post.id for _, post in created if post.has_images]
+            if with_images:
+                derivative_pipeline.submit_posts(with_images)
+        return [results[number] for number, _ in chunk]
+
+    def run(self, user, rows_path, fmt, archive_path, max_images, max_image_size):
+        """Yields one NDJSON line per input row and a closing summary line."""
+        totals = {'created': 0, 'error': 0}
+        rows = read_rows(rows_path, fmt)
+        imported = 0
+        truncated = False
+        try:
+            while chunk := list(itertools.islice(rows, self.chunk_size)):
+                if imported + len(chunk) > self.max_rows:
+                    chunk = chunk[:self.max_rows - imported]
+                imported += len(chunk)
+                for result in self._import_chunk(chunk, user, archive_path, max_images, max_image_size):
+                    totals[result['status']] += 1
+                    yield current_app.json.dumps(result) + '\n'
+                if imported >= self.max_rows:
+                    truncated = next(rows, None) is not None
+                    break
+        except (UnicodeDecodeError, csv.Error) as e:
+            yield current_app.json.dumps({'status': 'aborted', 'msg': f'Unreadable input: {e}'}) + '\n'
+        yield current_app.json.dumps({'summary': totals, 'truncated': truncated}) + '\n'
+
+
+bulk_importer = BulkImporter()
@@ -0,0 +1,160 @@
+from collections import OrderedDict, Counter
+from functools import wraps
+from flask import g, request, make_response, Response
+from ..extensions import redis_client
+import json
+import threading
+import time
+
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key):
+        # Counters are kept apart from the LRU so a namespace version can never be evicted
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisCacheBackend:
+    def __init__(self, client, prefix='cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class ResponseCache:
+    """Read-through cache of serialized JSON responses.
+
+    Single-object entries live under '<namespace>:<id>' and are deleted directly,
+    listing namespaces like the feed are versioned and dropped all at once by bumping the version.
+    Deletes and version bumps reach every worker only through the Redis backend, the memory one
+    is for tests and single-process development servers and refuses to start under several
+    gunicorn workers.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 30
+        self.routes = {}
+        self.stats = Counter()
+
+    def init_app(self, app):
+        self.ttl = app.config['CACHE_TTL']
+        self.routes = app.config['CACHE_ROUTES']
+        if app.config['CACHE_BACKEND'] == 'redis':
+            url = app.config['CACHE_REDIS_URL']
+            self.backend = RedisCacheBackend(redis_client.connect(app, url) if url else redis_client.client)
+        else:
+            # Workers would go on serving entries another one already invalidated
+            if app.config['WEB_CONCURRENCY'] > 1:
+                raise RuntimeError("CACHE_BACKEND = 'memory' serves a single process, set REDIS_URL "
+                                   "or CACHE_BACKEND = 'redis' to run several workers")
+            self.backend = MemoryCacheBackend(app.config['CACHE_MAX_ENTRIES'])
+
+    def _key(self, namespace, key, versioned):
+        if versioned:
+            version = self._safe(self.backend.get, f'{namespace}:version') or 0
+            if isinstance(version, bytes):
+                version = version.decode()
+            return f'{namespace}:v{version}:{key}'
+        return f'{namespace}:{key}'
+
+    def _safe(self, fn, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f'Cache backend error: {e}')
+            return None
+
+    def cached(self, namespace, versioned=False):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.routes.get(namespace):
+                    return view(*args, **kwargs)
+
+                arg_key = ','.join(f'{k}={v}' for k, v in sorted(kwargs.items()))
+                if versioned and request.query_string:
+                    arg_key += '?' + request.query_string.decode()
+                key = self._key(namespace, arg_key, versioned)
+
+                # Set by conditional(), an entry rendered from another version of the data is a miss
+                version = g.get('response_version')
+                stored = self._safe(self.backend.get, key)
+                if stored is not None:
+                    stored = json.loads(stored)
+                    if stored.get('version') == version:
+                        self.stats[f'{namespace}_hits'] += 1
+                        response = Response(stored['body'], status=stored['status'], headers=stored['headers'])
+                        response.headers['X-Cache'] = 'HIT'
+                        return response
+
+                self.stats[f'{namespace}_misses'] += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    stored = json.dumps({
+                        'version': version,
+                        'status': response.status_code,
+                        'headers': [(k, v) for k, v in response.headers if k != 'Content-Length'],
+                        'body': response.get_data(as_text=True)
+                    })
+                    self._safe(self.backend.set, key, stored, self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, namespace, *keys):
+        if keys:
+            self._safe(self.backend.delete, *(f'{namespace}:id={key}' for key in keys))
+
+    def invalidate_namespace(self, namespace):
+        self._safe(self.backend.incr, f'{namespace}:version')
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,157 @@
+from collections import namedtuple
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from ..extensions import db, jwt, redis_client
+from ..models import User, Profile
+from .revocation import CLOCK_SKEW
+import itertools
+import threading
+import time
+import uuid
+
+
+INVALIDATED_USERS_KEY = 'identity:invalidated'
+
+
+ProfileSnapshot = namedtuple('ProfileSnapshot', (
+    'name', 'surname', 'age', 'bio', 'phone_number', 'location', 'img_path', 'ava_variants', 'user_id'
+))
+
+
+class CurrentUser:
+    """Read-only snapshot of the authenticated user, handlers that write call load() for the ORM object."""
+
+    def __init__(self, id, email, reg_datetime, profile):
+        self.id = id
+        self.email = email
+        self.reg_datetime = reg_datetime
+        self.profile = profile
+        self._user = None
+
+    def load(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+
+class IdentityCache:
+    """Process-local snapshots of authenticated users, each kept for up to IDENTITY_CACHE_TTL.
+
+    invalidate() drops the snapshot here and publishes the user id to a Redis sorted set scored by
+    time. Every worker pulls the ids added since its last pull, at most every
+    IDENTITY_CACHE_SYNC_SECONDS, and drops their snapshots too, so an edit shows everywhere within
+    about that interval. While the pull has been failing for longer than
+    IDENTITY_CACHE_MAX_STALENESS seconds no snapshot is trusted and every lookup reads the database.
+    """
+
+    def __init__(self):
+        self.ttl = 30
+        self.max_entries = 10000
+        self.sync_interval = 1
+        self.max_staleness = 5
+        self._entries = {}
+        self._seen = {}
+        self._synced_score = 0
+        self._synced_at = 0
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        self.max_entries = app.config['IDENTITY_CACHE_MAX_ENTRIES']
+        self.sync_interval = app.config['IDENTITY_CACHE_SYNC_SECONDS']
+        self.max_staleness = app.config['IDENTITY_CACHE_MAX_STALENESS']
+
+    def _fetch(self, user_id):
+        # Kept for up to IDENTITY_CACHE_TTL, a copy read from a lagging replica would outlive the lag
+        row = db.session.execute(
+            select(User.id, User.email, User.reg_datetime,
+                   Profile.name, Profile.surname, Profile.age, Profile.bio, Profile.phone_number,
+                   Profile.location, Profile.img_path, Profile.ava_variants, Profile.user_id)
+            .outerjoin(Profile, Profile.user_id == User.id)
+            .where(User.id == user_id),
+            bind_arguments={'bind': db.engine}
+        ).first()
+        if row is None:
+            return None
+        return row[:3], ProfileSnapshot(*row[3:]) if row.user_id is not None else None
+
+    def sync(self, now=None):
+        now = now or time.time()
+        self._next_sync = now + self.sync_interval
+        try:
+            entries = redis_client.client.zrangebyscore(INVALIDATED_USERS_KEY, self._synced_score - CLOCK_SKEW,
+                                                        '+inf', withscores=True)
+        except RedisError as e:
+            print(f'Error while syncing identity invalidations: {e}')
+            return
+
+        with self._lock:
+            for member, invalidated_at in entries:
+                # Entries inside the skew window come back on every pull, each is applied once
+                if member in self._seen:
+                    continue
+                self._seen[member] = invalidated_at
+                self._entries.pop(int(member.split(':', 1)[0]), None)
+                self._synced_score = max(self._synced_score, invalidated_at)
+            self._seen = {member: score for member, score in self._seen.items()
+                          if score >= self._synced_score - CLOCK_SKEW}
+            self._synced_at = now
+
+    def get(self, user_id):
+        wall = time.time()
+        if wall >= self._next_sync:
+            self.sync(wall)
+        if wall - self._synced_at > self.max_staleness:
+            # Edits made on other workers may be missing, nothing cached is served or stored
+            return self._wrap(self._fetch(user_id))
+
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < now:
+            data = self._fetch(user_id)
+            if data is None:
+                with self._lock:
+                    self._entries.pop(user_id, None)
+                return None
+            entry = (now + self.ttl, data)
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    # Still full of live snapshots, the oldest tenth goes
+                    for key in list(itertools.islice(self._entries, max(self.max_entries // 10, 1))):
+                        del self._entries[key]
+                self._entries[user_id] = entry
+        return self._wrap(entry[1])
+
+    def _wrap(self, data):
+        if data is None:
+            return None
+        (id, email, reg_datetime), profile = data
+        # A fresh wrapper per request, only the plain data is shared between requests
+        return CurrentUser(id, email, reg_datetime, profile)
+
+    def invalidate(self, *user_ids):
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        now = time.time()
+        try:
+            pipe = redis_client.client.pipeline()
+            pipe.zadd(INVALIDATED_USERS_KEY, {f'{user_id}:{uuid.uuid4().hex}': now for user_id in user_ids})
+            # Snapshots older than the TTL are gone anyway, so are the entries that dropped them
+            pipe.zremrangebyscore(INVALIDATED_USERS_KEY, 0, now - self.ttl - CLOCK_SKEW)
+            pipe.execute()
+        except RedisError as e:
+            print(f'Error while publishing identity invalidations: {e}')
+
+
+identity_cache = IdentityCache()
+
+
+@jwt.user_lookup_loader
+def user_lookup_callback(_jwt_header, jwt_data):
+    return identity_cache.get(int(jwt_data["sub"]))
@@ -0,0 +1,69 @@
+from flask import jsonify, send_file, request, current_app
+from werkzeug.security import safe_join
+from datetime import datetime, timezone
+from .thumbnails import DERIVED_DIR
+import mimetypes
+import os
+
+
+IMMUTABLE_PREFIXES = ('uploads/objects/',)
+
+
+def _cache_response(response, rel_path):
+    max_age = current_app.config['IMAGE_CACHE_MAX_AGE']
+    # Variants keep their names when 'flask regenerate-derivatives' renders them again
+    if rel_path.startswith(IMMUTABLE_PREFIXES) and f'/{DERIVED_DIR}/' not in rel_path:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        # Files from before the object store and variants are overwritten in place, so clients must revalidate
+        # with the ETag
+        response.cache_control.no_cache = True
+    return response
+
+
+def _offload(full_path, rel_path, stat):
+    backend = current_app.config['IMAGE_SENDFILE_BACKEND']
+    response = current_app.response_class(mimetype=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+
+    # The front server handles Range, the validators still let us answer 304 without handing off
+    response.set_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response.last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # A handoff header would make the front server send the file body anyway
+        return response
+
+    if backend == 'nginx':
+        prefix = current_app.config['IMAGE_ACCEL_REDIRECT_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{rel_path}'
+    else:
+        response.headers['X-Sendfile'] = full_path
+    return response
+
+
+def serve_upload(f_path):
+    rel_path = f_path.replace('\\', '/')
+    if not rel_path.startswith('uploads/'):
+        return jsonify(msg='Wrong directory'), 404
+
+    full_path = safe_join(os.getcwd(), rel_path)
+    staging = os.path.abspath(current_app.config['UPLOAD_STAGING_FOLDER'])
+    if full_path and os.path.commonpath([full_path, staging]) == staging:
+        # Uploads still streaming in or not yet claimed by a post
+        return jsonify(msg='File not found'), 404
+    try:
+        stat = os.stat(full_path) if full_path else None
+    except OSError:
+        stat = None
+    if stat is None or not os.path.isfile(full_path):
+        return jsonify(msg='File not found'), 404
+
+    if current_app.config['IMAGE_SENDFILE_BACKEND']:
+        response = _offload(full_path, rel_path, stat)
+    else:
+        # conditional=True gives strong ETag/Last-Modified, 304 answers and Range support
+        response = send_file(full_path, conditional=True, etag=True, last_modified=stat.st_mtime)
+    return _cache_response(response, rel_path)
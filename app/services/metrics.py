@@ -0,0 +1,223 @@
+from flask import g, request, has_request_context, jsonify, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .cache import response_cache
+import glob
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FS_AUDIT_EVENTS = frozenset((
+    'open', 'os.listdir', 'os.scandir', 'os.remove', 'os.rename', 'os.mkdir', 'os.rmdir', 'shutil.rmtree'
+))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            buckets = self.histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += value
+            buckets[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, buckets] for (name, labels), buckets in self.histograms.items()]
+            }
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(buckets))
+            histograms[key] = [a + b for a, b in zip(merged, buckets)]
+    return counters, histograms
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+
+
+def render_exposition(counters, histograms):
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {name} counter')
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {name} histogram')
+        for (n, labels), buckets in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {buckets[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {buckets[-2]}')
+            lines.append(f'{name}_count{_labels(labels)} {buckets[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """Per-request latency, SQL, filesystem, Redis and response size metrics in Prometheus format.
+
+    With METRICS_MULTIPROC_DIR set every gunicorn worker periodically writes its totals to
+    <dir>/<pid>.json and /metrics sums all of them, otherwise only the answering worker is reported.
+    /metrics answers only requests bearing METRICS_TOKEN and does not exist without one.
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.multiproc_dir = None
+        self.flush_seconds = 5
+        self.slow_request_ms = None
+        self.token = None
+        self._last_flush = 0
+
+    def init_app(self, app):
+        self.multiproc_dir = app.config['METRICS_MULTIPROC_DIR']
+        self.flush_seconds = app.config['METRICS_FLUSH_SECONDS']
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+        self.token = app.config['METRICS_TOKEN']
+        if self.multiproc_dir:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        if not getattr(Metrics, '_hooks_installed', False):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            sys.addaudithook(_audit_hook)
+            Metrics._hooks_installed = True
+
+    def _before_request(self):
+        g.metrics = {'started': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'fs_count': 0,
+                     'redis_count': 0, 'redis_time': 0.0,
+                     'statements': [] if self.slow_request_ms is not None else None}
+
+    def _after_request(self, response):
+        stats = g.pop('metrics', None)
+        if stats is None:
+            return response
+
+        elapsed = time.perf_counter() - stats['started']
+        endpoint = request.endpoint or 'unmatched'
+        labels = {'endpoint': endpoint}
+        registry = self.registry
+        registry.observe('http_request_duration_seconds', labels, elapsed)
+        registry.inc('http_requests_total', {'endpoint': endpoint, 'method': request.method,
+                                             'status': response.status_code})
+        registry.inc('db_statements_total', labels, stats['sql_count'])
+        registry.inc('db_statement_seconds_total', labels, stats['sql_time'])
+        registry.inc('fs_calls_total', labels, stats['fs_count'])
+        registry.inc('redis_commands_total', labels, stats['redis_count'])
+        registry.inc('redis_command_seconds_total', labels, stats['redis_time'])
+        registry.inc('http_response_bytes_total', labels, response.content_length or 0)
+
+        if self.slow_request_ms is not None and elapsed * 1000 >= self.slow_request_ms:
+            statements = '\n'.join(f'  {ms:.1f} ms  {sql}' for sql, ms in stats['statements'])
+            print(
+                f'Slow request {request.method} {request.full_path.rstrip("?")} took {elapsed * 1000:.1f} ms, '
+                f'{stats["sql_count"]} SQL statements ({stats["sql_time"] * 1000:.1f} ms):\n{statements}'
+            )
+
+        if self.multiproc_dir and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+        return response
+
+    def observe_redis(self, seconds):
+        if has_request_context() and 'metrics' in g:
+            g.metrics['redis_count'] += 1
+            g.metrics['redis_time'] += seconds
+
+    def _cache_snapshot(self):
+        counters = []
+        for key, value in response_cache.stats.items():
+            namespace, result = key.rsplit('_', 1)
+            counters.append(['cache_requests_total', [['namespace', namespace], ['result', result]], value])
+        return {'counters': counters, 'histograms': []}
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        snapshot = self.registry.snapshot()
+        snapshot['counters'] += self._cache_snapshot()['counters']
+        path = os.path.join(self.multiproc_dir, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def metrics_view(self):
+        if not self.token:
+            return jsonify(msg='Not found'), 404
+        auth = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth.encode(), f'Bearer {self.token}'.encode()):
+            return jsonify(msg='Missing or wrong metrics token'), 401
+
+        if self.multiproc_dir:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.multiproc_dir, '*.json')):
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        else:
+            snapshots = [self.registry.snapshot(), self._cache_snapshot()]
+
+        counters, histograms = _merge(snapshots)
+        return Response(render_exposition(counters, histograms), mimetype='text/plain; version=0.0.4')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'metrics' not in g or not conn.info.get('query_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats = g.metrics
+    stats['sql_count'] += 1
+    stats['sql_time'] += elapsed
+    if stats['statements'] is not None:
+        stats['statements'].append((statement, elapsed * 1000))
+
+
+def _audit_hook(name, args):
+    if name in FS_AUDIT_EVENTS and has_request_context() and 'metrics' in g:
+        g.metrics['fs_count'] += 1
+
+
+metrics = Metrics()
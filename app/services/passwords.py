@@ -0,0 +1,105 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as PoolTimeout
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from .slots import RedisSlots
+import multiprocessing
+import os
+import threading
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+def hash_parameters(method):
+    """Method and cost of a werkzeug method string with its defaults filled in, as stored hashes record them."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return (name, *map(int, args or (2**15, 8, 1)))
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        return name, hash_name, int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+    return (name, *args)
+
+
+class PasswordHasher:
+    """Runs password hashing in a bounded process pool so a login burst cannot pin every request worker.
+
+    When PASSWORD_HASH_QUEUE_LIMIT hashes are in flight in this worker, or PASSWORD_HASH_GLOBAL_LIMIT
+    across all of them as counted in Redis, new ones fail fast with HashPoolBusy, and so does a hash
+    that takes longer than PASSWORD_HASH_TIMEOUT. A slot is held until its job has really finished.
+    PASSWORD_HASH_WORKERS = 0 hashes inline.
+    """
+
+    def __init__(self):
+        self.method = 'scrypt:32768:8:1'
+        self.workers = 0
+        self.timeout = None
+        self._slots = None
+        self._global_slots = None
+        self._pool = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+        # Each sync worker has its own pool, only a shared count bounds the hashes of the whole deployment
+        if app.config['PASSWORD_HASH_GLOBAL_LIMIT']:
+            self._global_slots = RedisSlots('password_hash:slots', app.config['PASSWORD_HASH_GLOBAL_LIMIT'],
+                                            self.timeout * 3)
+
+    def _get_pool(self):
+        # forkserver children do not inherit the request worker's threads or open connections
+        if self._pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('forkserver'))
+            self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        admitted, token = self._global_slots.acquire() if self._global_slots else (True, None)
+        if not admitted:
+            self._slots.release()
+            raise HashPoolBusy()
+
+        def release(_=None):
+            if token is not None:
+                self._global_slots.release(token)
+            self._slots.release()
+
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                release()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            release()
+            raise
+        # A timed out hash keeps its process busy, its slot is given back only when it is done
+        future.add_done_callback(release)
+        try:
+            return future.result(timeout=self.timeout)
+        except PoolTimeout:
+            future.cancel()
+            raise HashPoolBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, hash_, password):
+        return self._run(check_password_hash, hash_, password)
+
+    def needs_rehash(self, hash_):
+        try:
+            return hash_parameters(hash_.split('$', 1)[0]) != hash_parameters(self.method)
+        except ValueError:
+            # Not a hash werkzeug wrote, the next successful login replaces it
+            return True
+
+
+password_hasher = PasswordHasher()
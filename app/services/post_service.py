@@ -0,0 +1,225 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import func, select, update, tuple_
+from sqlalchemy.orm import selectinload, defer, with_expression
+from ..extensions import db, ALLOWED_EXTENSIONS
+from ..models import Post, PostImage, Profile
+from ..utils.pagination import encode_cursor, decode_cursor
+from .thumbnails import derivative_path
+import math
+import os
+
+
+SUMMARY_LENGTH = 160
+POST_FIELDS = ('id', 'creator_id', 'title', 'description', 'summary', 'price', 'time', 'location',
+               'image', 'thumbnail', 'img_path')
+# Cards only show a snippet, the full description is sent by the detail view or on request with fields=
+LIST_FIELDS = frozenset(POST_FIELDS) - {'description'}
+DETAIL_FIELDS = frozenset(POST_FIELDS) - {'summary'}
+# What numbered pages returned before fields= existed, old clients render the description from it
+PAGE_FIELDS = frozenset(('id', 'title', 'price', 'location', 'time', 'description', 'image'))
+IMAGE_FIELDS = frozenset(('image', 'thumbnail', 'img_path'))
+INVENTORY_FIELDS = frozenset(('id', 'title', 'price', 'time', 'location'))
+
+PostSort = namedtuple('PostSort', ('column', 'descending', 'parse'))
+# Every order ends on id so keyset cursors are unambiguous, each one has a matching composite index
+POST_SORTS = {
+    'newest': PostSort('creation_date', True, datetime.fromisoformat),
+    'price_asc': PostSort('price', False, Decimal),
+    'price_desc': PostSort('price', True, Decimal)
+}
+DEFAULT_SORT = 'newest'
+
+
+def with_post_relations(query, fields=DETAIL_FIELDS):
+    # The image manifest comes in with one IN query, only when the requested fields need it
+    options = []
+    if fields & IMAGE_FIELDS:
+        options.append(selectinload(Post.images))
+    if 'description' not in fields:
+        options.append(defer(Post.description))
+    if 'summary' in fields:
+        # One character more than the snippet tells whether it has to be cut
+        options.append(with_expression(Post.summary, func.substr(Post.description, 1, SUMMARY_LENGTH + 1)))
+    return query.options(*options)
+
+
+def validate_new_post(title, price, description):
+    # Shared by create_post and the bulk import, returns (price, error message)
+    if not all([title, price, description]):
+        return None, 'Missing some fields'
+    elif not isinstance(title, str) or len(title.strip()) < 4:
+        return None, 'The title must be at least 5 characters long'
+    elif len(title) > Post.title.type.length:
+        return None, f'The title must be at most {Post.title.type.length} characters long'
+    elif not isinstance(description, str) or len(description.strip()) < 10:
+        return None, 'The description must be at least 10 characters long'
+    elif len(description) > Post.description.type.length:
+        return None, f'The description must be at most {Post.description.type.length} characters long'
+
+    try:
+        price = float(price)
+    except (ValueError, TypeError):
+        return None, 'Invalid price format'
+    if not math.isfinite(price):
+        return None, 'Invalid price format'
+    if price <= 0:
+        return None, 'The price must be positive'
+    return price, None
+
+
+def filter_posts(query, min_price=None, max_price=None, location=None, sort=None):
+    # Given a sort on another column, a price range would lead the optimizer to the price index and an
+    # in-memory sort. price + 0 keeps it on the sort's index, whose trailing price column answers the range
+    price = Post.price + 0 if sort is not None and POST_SORTS[sort].column != 'price' else Post.price
+    if location is not None:
+        query = query.filter(Post.location == location)
+    if min_price is not None:
+        query = query.filter(price >= min_price)
+    if max_price is not None:
+        query = query.filter(price <= max_price)
+    return query
+
+
+def sort_posts(query, sort=DEFAULT_SORT):
+    column = getattr(Post, POST_SORTS[sort].column)
+    if POST_SORTS[sort].descending:
+        return query.order_by(column.desc(), Post.id.desc())
+    return query.order_by(column.asc(), Post.id.asc())
+
+
+def posts_after(query, cursor, sort=DEFAULT_SORT):
+    order = POST_SORTS[sort]
+    key, post_id = decode_cursor(cursor, None if sort == DEFAULT_SORT else sort, order.parse)
+    keyset = tuple_(getattr(Post, order.column), Post.id)
+    return query.filter(keyset < (key, post_id) if order.descending else keyset > (key, post_id))
+
+
+def post_cursor(post, sort=DEFAULT_SORT):
+    return encode_cursor(getattr(post, POST_SORTS[sort].column), post.id, None if sort == DEFAULT_SORT else sort)
+
+
+def creator_location(user_id):
+    # Evaluated by the INSERT itself, the user loaded for the request may hold an older profile
+    return select(Profile.location).where(Profile.user_id == user_id).scalar_subquery()
+
+
+def seller_inventory(user_id, cursor=None):
+    # Plain rows of the listed columns, served from the (creator_id, creation_date, id) index
+    query = sort_posts(db.session.query(Post.id, Post.title, Post.price, Post.creation_date, Post.location)
+                       .filter(Post.creator_id == user_id))
+    return posts_after(query, cursor) if cursor else query
+
+
+def seller_stats(user_id):
+    count, min_price, max_price, last_post = db.session.execute(
+        select(func.count(Post.id), func.min(Post.price), func.max(Post.price), func.max(Post.creation_date))
+        .where(Post.creator_id == user_id)
+    ).one()
+    return {'count': count, 'min_price': min_price, 'max_price': max_price, 'last_post_time': last_post}
+
+
+# Posts from before updated_at existed count as last changed on creation
+_post_stamp = func.coalesce(Post.updated_at, Post.creation_date).label('updated_at')
+
+
+def post_version(id):
+    row = db.session.execute(select(_post_stamp).where(Post.id == id)).first()
+    return str(row.updated_at) if row else None
+
+
+def page_version(page):
+    # Same order and window as the page itself, ids catch posts moving in or out of it
+    per_page = current_app.config['POSTS_PER_PAGE']
+    rows = db.session.execute(
+        sort_posts(select(Post.id, _post_stamp)).offset((page - 1) * per_page).limit(per_page)
+    ).all()
+    if not rows:
+        return None
+    return f'{max(row.updated_at for row in rows)}:{",".join(str(row.id) for row in rows)}'
+
+
+def post_images(post):
+    return [im.path for im in post.images]
+
+
+def image_variant(post, image, variant):
+    return derivative_path(image.path, variant) if image.has_variants else image.path
+
+
+def scan_post_images(path):
+    if not path or not os.path.isdir(path):
+        return []
+    return [f for f in sorted(os.listdir(path)) if os.path.splitext(f)[1].lower() in ALLOWED_EXTENSIONS]
+
+
+def backfill_post_images(batch_size=500):
+    scanned = created = 0
+    last_id = 0
+    while True:
+        posts = Post.query.options(selectinload(Post.images)).filter(Post.id > last_id) \
+            .order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+
+        for post in posts:
+            scanned += 1
+            if post.images:
+                continue
+            for position, filename in enumerate(scan_post_images(post.img_path), start=1):
+                db.session.add(PostImage(post_id=post.id, position=position, filename=filename))
+                created += 1
+
+        last_id = posts[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+    return scanned, created
+
+
+def backfill_post_locations(batch_size=1000):
+    # Copies Profile.location onto posts created before the column existed, one id range per transaction
+    updated = 0
+    last_id = 0
+    max_id = db.session.scalar(select(func.max(Post.id))) or 0
+    location = select(Profile.location).where(Profile.user_id == Post.creator_id).scalar_subquery()
+    while last_id < max_id:
+        result = db.session.execute(
+            update(Post).where(Post.id > last_id, Post.id <= last_id + batch_size)
+            .values(location=location, updated_at=datetime.now(timezone.utc))
+        )
+        db.session.commit()
+        updated += result.rowcount
+        last_id += batch_size
+    return updated
+
+
+def summarize(text):
+    if text is None or len(text) <= SUMMARY_LENGTH:
+        return text
+    return text[:SUMMARY_LENGTH].rsplit(' ', 1)[0].rstrip() + '…'
+
+
+def _image(post, variant):
+    return image_variant(post, post.images[0], variant) if post.images else None
+
+
+POST_SERIALIZERS = {
+    'id': lambda post: post.id,
+    'creator_id': lambda post: post.creator_id,
+    'title': lambda post: post.title,
+    'description': lambda post: post.description,
+    'summary': lambda post: summarize(post.summary),
+    'price': lambda post: post.price,
+    'time': lambda post: post.creation_date,
+    'location': lambda post: post.location,
+    'image': lambda post: _image(post, 'card'),
+    'thumbnail': lambda post: _image(post, 'thumb'),
+    'img_path': post_images
+}
+
+
+def serialize_post(post, fields=DETAIL_FIELDS):
+    return {name: POST_SERIALIZERS[name](post) for name in POST_FIELDS if name in fields}
@@ -0,0 +1,30 @@
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from ..extensions import db
+from ..models import Profile
+from .thumbnails import derivative_path
+
+
+def with_user(query):
+    return query.options(joinedload(Profile.user))
+
+
+def profile_version(id):
+    row = db.session.execute(select(Profile.updated_at).where(Profile.user_id == id)).first()
+    return str(row.updated_at) if row else None
+
+
+def serialize_profile(pr):
+    return {
+        'name': pr.name,
+        'surname': pr.surname,
+        'age': pr.age,
+        'bio': pr.bio,
+        'phone_number': pr.phone_number,
+        'location': pr.location,
+        'img_path': pr.img_path,
+        'ava_thumb': derivative_path(pr.img_path, 'thumb') if pr.ava_variants else pr.img_path,
+        'user_id': pr.user_id,
+        'email': pr.user.email,
+        'reg_time': pr.user.reg_datetime
+    }
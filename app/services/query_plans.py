@@ -0,0 +1,56 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import select
+from ..extensions import db
+from ..models import Post
+from ..utils.pagination import encode_cursor
+from .post_service import POST_SORTS, DEFAULT_SORT, filter_posts, sort_posts, posts_after, seller_inventory
+import re
+
+
+QueryPlan = namedtuple('QueryPlan', ('indexes', 'full_scan', 'filesort'))
+SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+def explain(statement):
+    conn = db.session.connection()
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+
+    if conn.dialect.name == 'mysql':
+        rows = [row for row in conn.exec_driver_sql(f'EXPLAIN {sql}').mappings() if row['table'] == 'posts']
+        return QueryPlan([row['key'] for row in rows if row['key']],
+                         any(row['type'] == 'ALL' for row in rows),
+                         any('filesort' in (row['Extra'] or '') for row in rows))
+    if conn.dialect.name == 'sqlite':
+        details = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+        return QueryPlan([name for detail in details for name in SQLITE_INDEX_RE.findall(detail)],
+                         any(detail.startswith('SCAN posts') and 'INDEX' not in detail for detail in details),
+                         any('TEMP B-TREE' in detail for detail in details))
+    raise ValueError(f'EXPLAIN is not supported for {conn.dialect.name}')
+
+
+def feed_query_plans(page_size=10):
+    # Sample values only shape the plan, the optimizer must pick an index whatever they are
+    location = db.session.scalar(select(Post.location).where(Post.location.isnot(None)).limit(1)) or 'Kyiv'
+    filter_sets = {
+        'no filter': {},
+        'price range': {'min_price': Decimal('10'), 'max_price': Decimal('1000')},
+        'location': {'location': location},
+        'location + price range': {'location': location, 'min_price': Decimal('10'), 'max_price': Decimal('1000')}
+    }
+    cursor_keys = {'creation_date': datetime.now(timezone.utc).replace(tzinfo=None), 'price': Decimal('500')}
+
+    for sort, order in POST_SORTS.items():
+        cursor = encode_cursor(cursor_keys[order.column], 1000, None if sort == DEFAULT_SORT else sort)
+        for label, filters in filter_sets.items():
+            for page in ('first page', 'next page'):
+                statement = sort_posts(filter_posts(select(Post), sort=sort, **filters), sort)
+                if page == 'next page':
+                    statement = posts_after(statement, cursor, sort)
+                yield f'{sort}, {label}, {page}', explain(statement.limit(page_size + 1))
+
+    cursor = encode_cursor(cursor_keys['creation_date'], 1000)
+    for page, page_cursor in (('first page', None), ('next page', cursor)):
+        query = seller_inventory(1, page_cursor).limit(page_size + 1)
+        yield f'seller inventory, {page}', explain(query.statement)
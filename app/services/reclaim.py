@@ -0,0 +1,264 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import select, delete
+from ..extensions import db, ALLOWED_EXTENSIONS
+from ..models import Post, PostImage, Profile, StoredObject
+from .thumbnails import DERIVED_DIR, derivative_path
+import glob
+import itertools
+import os
+import shutil
+import threading
+import time
+
+
+def _disk_usage(path):
+    if os.path.isfile(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(folder, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _delete(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+class StorageReclaimer:
+    """Deletes files of removed posts and avatars on a background thread instead of inside the request.
+
+    Paths are queued only after the commit that orphaned them. Whatever is lost to a full queue
+    or a restart stays on disk until 'flask sweep-uploads' finds it.
+    """
+
+    def __init__(self):
+        self.upload_folder = None
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._workers = 1
+
+    def init_app(self, app):
+        self.upload_folder = os.path.realpath(app.config['UPLOAD_FOLDER'])
+        self._workers = app.config['RECLAIM_WORKERS']
+        self._slots = threading.BoundedSemaphore(app.config['RECLAIM_QUEUE_LIMIT'])
+
+    def _get_executor(self):
+        # gunicorn forks workers after import, each one needs its own threads
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='reclaim')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _inside_uploads(self, path):
+        return os.path.realpath(path).startswith(self.upload_folder + os.sep)
+
+    def remove(self, *paths):
+        paths = [path for path in paths if path]
+        rejected = [path for path in paths if not self._inside_uploads(path)]
+        if rejected:
+            print(f'Refusing to remove paths outside of the upload folder: {rejected}')
+        paths = [path for path in paths if path not in rejected]
+        if not paths:
+            return
+        if not self._slots.acquire(blocking=False):
+            print(f'Reclaim queue is full, leaving {paths} to the sweeper')
+            return
+
+        def job():
+            try:
+                for path in paths:
+                    try:
+                        _delete(path)
+                    except FileNotFoundError:
+                        pass
+                    except Exception as e:
+                        print(f'Error while removing {path}: {e}')
+            finally:
+                self._slots.release()
+
+        self._get_executor().submit(job)
+
+    def remove_avatar(self, img_path):
+        if img_path:
+            variants = [derivative_path(img_path, variant) for variant in current_app.config['THUMBNAIL_SIZES']]
+            self.remove(img_path, *variants)
+
+
+storage_reclaimer = StorageReclaimer()
+
+
+class UploadSweeper:
+    """Finds files under uploads/ that no database row points to and removes them.
+
+    Directories are streamed with scandir and checked against the database batch_size entries at a
+    time. Anything modified within min_age seconds is left alone, which covers uploads that are
+    still in flight: stored objects and post directories exist before the transaction that refers
+    to them commits. Objects are deleted once their reference count has been zero for min_age.
+    Posts without post_images rows are skipped, run 'flask backfill-post-images' first.
+    """
+
+    def __init__(self, upload_folder, staging_folder, batch_size=500, min_age=3600, dry_run=False):
+        self.upload_folder = upload_folder
+        self.staging_folder = staging_folder
+        self.batch_size = batch_size
+        self.cutoff = time.time() - min_age
+        self.dry_run = dry_run
+        self.report = Counter()
+
+    def _old_enough(self, path):
+        try:
+            return os.lstat(path).st_mtime < self.cutoff
+        except FileNotFoundError:
+            return False
+
+    def _reclaim(self, path, force=False):
+        if not force and not self._old_enough(path):
+            self.report['skipped_recent'] += 1
+            return
+        size = _disk_usage(path)
+        is_dir = os.path.isdir(path)
+        if not self.dry_run:
+            try:
+                _delete(path)
+            except FileNotFoundError:
+                return
+            except OSError as e:
+                print(f'Error while removing {path}: {e}')
+                return
+        self.report['dirs' if is_dir else 'files'] += 1
+        self.report['bytes'] += size
+
+    def _batches(self, folder, predicate):
+        if not os.path.isdir(folder):
+            return
+        batch = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if predicate(entry):
+                    batch.append(entry)
+                    if len(batch) >= self.batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def _sweep_folder(self, folder, keep_names):
+        # Originals not in keep_names go, so do derived variants of names that are gone
+        keep_stems = {os.path.splitext(name)[0] for name in keep_names}
+        for entry in os.scandir(folder):
+            if entry.name == DERIVED_DIR and entry.is_dir():
+                for variant in os.scandir(entry.path):
+                    if variant.name.rsplit('_', 1)[0] not in keep_stems:
+                        self._reclaim(variant.path)
+            elif entry.name not in keep_names:
+                self._reclaim(entry.path)
+
+    def sweep_posts(self):
+        root = os.path.join(self.upload_folder, 'posts')
+        for batch in self._batches(root, lambda e: e.is_dir() and e.name.isdigit()):
+            ids = [int(entry.name) for entry in batch]
+            existing = set(db.session.scalars(select(Post.id).where(Post.id.in_(ids))))
+            filenames = {}
+            for post_id, filename in db.session.execute(
+                    select(PostImage.post_id, PostImage.filename).where(PostImage.post_id.in_(existing))):
+                filenames.setdefault(post_id, set()).add(filename)
+            db.session.rollback()
+
+            for entry in batch:
+                post_id = int(entry.name)
+                if post_id not in existing:
+                    self._reclaim(entry.path)
+                elif post_id in filenames:
+                    self._sweep_folder(entry.path, filenames[post_id])
+
+    def sweep_avatars(self):
+        root = os.path.join(self.upload_folder, 'avas')
+        for batch in self._batches(root, lambda e: e.is_file()):
+            paths = {os.path.join('uploads', 'avas', entry.name): entry for entry in batch}
+            used = set(db.session.scalars(select(Profile.img_path).where(Profile.img_path.in_(paths))))
+            db.session.rollback()
+            for path, entry in paths.items():
+                if path not in used:
+                    self._reclaim(entry.path)
+
+        derived = os.path.join(root, DERIVED_DIR)
+        for batch in self._batches(derived, lambda e: e.is_file()):
+            stems = {entry.name.rsplit('_', 1)[0] for entry in batch}
+            candidates = [os.path.join('uploads', 'avas', stem + ext) for stem in stems for ext in ALLOWED_EXTENSIONS]
+            used = {os.path.splitext(os.path.basename(path))[0]
+                    for path in db.session.scalars(select(Profile.img_path).where(Profile.img_path.in_(candidates)))}
+            db.session.rollback()
+            for entry in batch:
+                if entry.name.rsplit('_', 1)[0] not in used:
+                    self._reclaim(entry.path)
+
+    def sweep_objects(self):
+        released_before = datetime.fromtimestamp(self.cutoff, timezone.utc)
+        last_id = 0
+        while True:
+            # Locked rows make a concurrent upload of the same bytes wait for us and then store it anew
+            objects = db.session.scalars(
+                select(StoredObject)
+                .where(StoredObject.id > last_id, StoredObject.refcount <= 0,
+                       StoredObject.released_at < released_before)
+                .order_by(StoredObject.id).limit(self.batch_size).with_for_update(skip_locked=True)
+            ).all()
+            if not objects:
+                break
+            for obj in objects:
+                for path in [obj.path] + glob.glob(derivative_path(obj.path, '*')):
+                    self._reclaim(path, force=True)
+            if not self.dry_run:
+                db.session.execute(delete(StoredObject).where(StoredObject.id.in_([obj.id for obj in objects])))
+            last_id = objects[-1].id
+            db.session.commit()
+
+        # Files without a row were stored by a request that failed before its commit
+        entries = self._object_files(os.path.join(self.upload_folder, 'objects'))
+        while batch := list(itertools.islice(entries, self.batch_size)):
+            digests = {digest for digest, _ in batch}
+            known = set(db.session.scalars(select(StoredObject.digest).where(StoredObject.digest.in_(digests))))
+            db.session.rollback()
+            for digest, path in batch:
+                if digest not in known:
+                    self._reclaim(path)
+
+    def _object_files(self, root):
+        for shard in self._subdirs(root):
+            for subshard in self._subdirs(shard):
+                for entry in os.scandir(subshard):
+                    if entry.is_file():
+                        yield os.path.splitext(entry.name)[0], entry.path
+                derived = os.path.join(subshard, DERIVED_DIR)
+                if os.path.isdir(derived):
+                    for entry in os.scandir(derived):
+                        yield entry.name.rsplit('_', 1)[0], entry.path
+
+    def _subdirs(self, folder):
+        if not os.path.isdir(folder):
+            return []
+        return sorted(entry.path for entry in os.scandir(folder) if entry.is_dir() and entry.name != DERIVED_DIR)
+
+    def sweep_staging(self):
+        # Staged uploads normally vanish with their request, old ones were left by a killed worker
+        for batch in self._batches(self.staging_folder, lambda e: e.is_file()):
+            for entry in batch:
+                self._reclaim(entry.path)
+
+    def run(self):
+        self.sweep_objects()
+        self.sweep_posts()
+        self.sweep_avatars()
+        self.sweep_staging()
+        return self.report
@@ -0,0 +1,83 @@
+from redis.exceptions import RedisError
+from ..extensions import redis_client
+import threading
+import time
+
+
+REVOKED_TOKENS_KEY = 'revoked_tokens'
+# Tolerated clock difference between workers that stamp revocations
+CLOCK_SKEW = 60
+
+
+class RevocationCache:
+    """Process-local copy of the JWT blocklist.
+
+    Revoked jtis are kept in a Redis sorted set scored by revocation time. Each worker pulls only
+    the entries added since its last sync, at most every JWT_REVOCATION_SYNC_SECONDS, so token
+    checks normally never leave the process. If Redis is unreachable the last known set keeps
+    being served and the pull is retried on the next interval, until the last successful pull is
+    older than JWT_REVOCATION_MAX_STALENESS seconds. From then on every token counts as revoked,
+    a logout elsewhere may be missing from the copy. None keeps serving the stale copy instead.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+        self.sync_interval = 5
+        self.retention = 7 * 24 * 3600
+        self.max_staleness = 30
+        self._revoked = {}
+        self._synced_at = 0
+        self._synced_score = 0
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sync_interval = app.config['JWT_REVOCATION_SYNC_SECONDS']
+        self.retention = app.config['JWT_REVOCATION_RETENTION']
+        self.max_staleness = app.config['JWT_REVOCATION_MAX_STALENESS']
+
+    @property
+    def _redis(self):
+        return self.client if self.client is not None else redis_client.client
+
+    def revoke(self, jti, expires_in):
+        now = time.time()
+        with self._lock:
+            self._revoked[jti] = now + expires_in
+        try:
+            pipe = self._redis.pipeline()
+            pipe.zadd(REVOKED_TOKENS_KEY, {jti: now})
+            pipe.zremrangebyscore(REVOKED_TOKENS_KEY, 0, now - self.retention)
+            pipe.execute()
+        except RedisError as e:
+            print(f'Error while publishing revoked token {jti}: {e}')
+
+    def is_revoked(self, jti):
+        now = time.time()
+        if now >= self._next_sync:
+            self.sync(now)
+        if self.max_staleness is not None and now - self._synced_at > self.max_staleness:
+            return True
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > now
+
+    def sync(self, now=None):
+        now = now or time.time()
+        self._next_sync = now + self.sync_interval
+        try:
+            entries = self._redis.zrangebyscore(REVOKED_TOKENS_KEY, self._synced_score - CLOCK_SKEW, '+inf',
+                                                withscores=True)
+        except RedisError as e:
+            print(f'Error while syncing revoked tokens: {e}')
+            return
+
+        with self._lock:
+            for jti, revoked_at in entries:
+                self._revoked.setdefault(jti, revoked_at + self.retention)
+                self._synced_score = max(self._synced_score, revoked_at)
+            self._synced_at = now
+            for jti in [jti for jti, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[jti]
+
+
+revocation_cache = RevocationCache()
@@ -0,0 +1,199 @@
+from collections import Counter
+from sqlalchemy import select, func
+from sqlalchemy.dialects.mysql import match
+from ..extensions import db
+from ..models import Post
+from ..utils.periodic import Periodic
+import heapq
+import math
+import re
+import threading
+import time
+
+
+TOKEN_RE = re.compile(r'\w+')
+TITLE_WEIGHT = 2
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def document_terms(title, description):
+    terms = Counter(tokenize(title))
+    for term in terms:
+        terms[term] *= TITLE_WEIGHT
+    terms.update(tokenize(description))
+    return terms
+
+
+class MemorySearchBackend:
+    """In-process inverted index over post titles and descriptions ranked with BM25.
+
+    Every worker keeps its own copy, built on a background thread when the worker takes its first
+    request and rebuilt there every SEARCH_INDEX_REFRESH_SECONDS to pick up writes handled by other
+    workers. Writes this worker handles while a build runs are replayed onto the new index, the
+    build's snapshot may predate them. Only searches that arrive before the first build wait for it.
+    """
+
+    def __init__(self, app, refresh_seconds=300, k1=1.2, b=0.75):
+        self.refresh_seconds = refresh_seconds
+        self.k1 = k1
+        self.b = b
+        self._app = app
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._total_len = 0
+        self._built_at = None
+        self._built = threading.Event()
+        # (post id, terms or None when removed) recorded while a build runs
+        self._pending = None
+        self._refresher = Periodic('search-index', self._refresh, refresh_seconds)
+
+    def rebuild(self):
+        # Recording starts before the snapshot is read, so no write falls between the two
+        with self._lock:
+            self._pending = []
+        try:
+            postings, doc_terms, doc_len, total_len = {}, {}, {}, 0
+            rows = db.session.execute(select(Post.id, Post.title, Post.description).execution_options(yield_per=1000))
+            for post_id, title, description in rows:
+                terms = document_terms(title, description)
+                doc_terms[post_id] = terms
+                doc_len[post_id] = sum(terms.values())
+                total_len += doc_len[post_id]
+                for term, tf in terms.items():
+                    postings.setdefault(term, {})[post_id] = tf
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            self._postings, self._doc_terms, self._doc_len, self._total_len = postings, doc_terms, doc_len, total_len
+            for post_id, terms in self._pending:
+                self._apply(post_id, terms)
+            self._pending = None
+            self._built_at = time.monotonic()
+        self._built.set()
+
+    def _refresh(self):
+        with self._app.app_context():
+            self.rebuild()
+
+    def start(self):
+        self._refresher.start()
+
+    def _remove(self, post_id):
+        terms = self._doc_terms.pop(post_id, None)
+        if not terms:
+            return
+        self._total_len -= self._doc_len.pop(post_id)
+        for term in terms:
+            docs = self._postings.get(term)
+            if docs is not None:
+                docs.pop(post_id, None)
+                if not docs:
+                    del self._postings[term]
+
+    def _apply(self, post_id, terms):
+        self._remove(post_id)
+        if terms is None:
+            return
+        self._doc_terms[post_id] = terms
+        self._doc_len[post_id] = sum(terms.values())
+        self._total_len += self._doc_len[post_id]
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[post_id] = tf
+
+    def _update(self, post_id, terms):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((post_id, terms))
+            if self._built_at is not None:
+                self._apply(post_id, terms)
+
+    def index_post(self, post):
+        self._update(post.id, document_terms(post.title, post.description))
+
+    def remove_post(self, post_id):
+        self._update(post_id, None)
+
+    def search(self, text, offset, limit, cap):
+        self.start()
+        # A build that fails is retried on the next refresh, searches then find nothing meanwhile
+        self._built.wait(10)
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs:
+                return [], 0, False
+            avg_len = self._total_len / n_docs
+
+            scores = {}
+            for term in set(tokenize(text)):
+                docs = self._postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for post_id, tf in docs.items():
+                    doc_len = self._doc_len[post_id]
+                    norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len / avg_len))
+                    scores[post_id] = scores.get(post_id, 0.0) + idf * norm
+
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        total = len(scores)
+        return [post_id for post_id, _ in top[offset:]], min(total, cap), total > cap
+
+
+class MySQLFulltextBackend:
+    """Delegates to the InnoDB FULLTEXT index on (title, description), which MySQL keeps up to date itself."""
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def search(self, text, offset, limit, cap):
+        score = match(Post.title, Post.description, against=text).in_natural_language_mode()
+        ids = db.session.scalars(
+            select(Post.id).where(score > 0).order_by(score.desc(), Post.id.desc()).offset(offset).limit(limit)
+        ).all()
+        # Counting stops at cap + 1 matches so huge result sets stay cheap
+        matched = select(Post.id).where(score > 0).limit(cap + 1).subquery()
+        total = db.session.scalar(select(func.count()).select_from(matched))
+        return ids, min(total, cap), total > cap
+
+
+class SearchEngine:
+    def __init__(self):
+        self.backend = None
+        self.total_cap = 1000
+
+    def init_app(self, app):
+        self.total_cap = app.config['SEARCH_TOTAL_CAP']
+        if app.config['SEARCH_BACKEND'] == 'mysql':
+            self.backend = MySQLFulltextBackend()
+        else:
+            self.backend = MemorySearchBackend(app, app.config['SEARCH_INDEX_REFRESH_SECONDS'])
+            app.before_request(self.backend.start)
+
+    def search(self, text, offset, limit):
+        return self.backend.search(text, offset, limit, self.total_cap)
+
+    def index_post(self, post):
+        try:
+            self.backend.index_post(post)
+        except Exception as e:
+            print(f'Error while indexing post {post.id}: {e}')
+
+    def remove_post(self, post_id):
+        try:
+            self.backend.remove_post(post_id)
+        except Exception as e:
+            print(f'Error while removing post {post_id} from search index: {e}')
+
+
+search_engine = SearchEngine()
@@ -0,0 +1,79 @@
+from redis.exceptions import RedisError
+from ..extensions import redis_client
+import fcntl
+import os
+import time
+import uuid
+
+
+# KEYS[1] sorted set of holders, ARGV limit, now, lease, holder token. Returns 1 when a slot was taken
+SLOT_SCRIPT = """
+local limit, now, lease = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - lease)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(lease))
+return 1
+"""
+
+
+class RedisSlots:
+    """At most limit holders at once across every worker and host, counted in a Redis sorted set.
+
+    A slot left behind by a killed worker expires after lease seconds. acquire() returns
+    (admitted, token to release), Redis errors admit without a token so an outage never blocks.
+    """
+
+    def __init__(self, key, limit, lease):
+        self.key = key
+        self.limit = limit
+        self.lease = lease
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        try:
+            admitted = redis_client.client.register_script(SLOT_SCRIPT)(
+                keys=[self.key], args=[self.limit, time.time(), self.lease, token])
+        except RedisError as e:
+            print(f'Error while taking a slot of {self.key}: {e}')
+            return True, None
+        return bool(admitted), token
+
+    def release(self, token):
+        if token is None:
+            return
+        try:
+            redis_client.client.zrem(self.key, token)
+        except RedisError as e:
+            print(f'Error while releasing a slot of {self.key}: {e}')
+
+
+class LocalSlots:
+    """At most limit holders at once across the workers of one host, each slot is a lock file.
+
+    flock locks belong to the open file, so they also exclude threads of one worker, and the
+    kernel drops them when a worker dies. acquire() returns (admitted, token to release).
+    """
+
+    def __init__(self, folder, name, limit):
+        self.paths = [os.path.join(folder, f'{name}.{i}.lock') for i in range(limit)]
+        os.makedirs(folder, exist_ok=True)
+
+    def acquire(self):
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            return True, fd
+        return False, None
+
+    def release(self, token):
+        if token is None:
+            return
+        # Closing the last descriptor of the file releases its lock
+        os.close(token)
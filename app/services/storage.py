@@ -0,0 +1,205 @@
+from collections import Counter
+from flask import current_app
+from datetime import datetime, timezone
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from ..extensions import db
+from ..models import StoredObject, Post, PostImage, Profile
+from ..utils.uploads import sniff_extension
+from .thumbnails import derivative_path, DERIVED_DIR
+import hashlib
+import os
+import shutil
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageStore:
+    """Content-addressed store for uploaded images under uploads/objects/, keyed by SHA-256.
+
+    Identical files are kept once and shared through a reference count held by post images and
+    avatars, and an object path never changes content so it is served as immutable. Objects whose
+    count dropped to zero stay on disk until 'flask sweep-uploads' collects them after its grace
+    period, so a concurrent upload of the same bytes can still claim them. All count changes
+    belong to the caller's transaction.
+    """
+
+    def _acquire(self, digest):
+        result = db.session.execute(
+            update(StoredObject).where(StoredObject.digest == digest)
+            .values(refcount=StoredObject.refcount + 1, released_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            return None
+        return db.session.scalars(
+            select(StoredObject).where(StoredObject.digest == digest).execution_options(populate_existing=True)
+        ).one()
+
+    def put(self, digest, ext, size, move_to):
+        """Returns (object, created), move_to(path) is called only when the content is not stored yet."""
+        obj = self._acquire(digest)
+        if obj is not None:
+            if not os.path.exists(obj.path):
+                # Collected between the sweeper's check and our claim, or lost on disk
+                os.makedirs(os.path.dirname(obj.path), exist_ok=True)
+                move_to(obj.path)
+            return obj, False
+
+        path = StoredObject.path_for(digest, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        move_to(path)
+        try:
+            with db.session.begin_nested():
+                obj = StoredObject(digest=digest, ext=ext, size=size, refcount=1)
+                db.session.add(obj)
+        except IntegrityError:
+            # Another request stored the same bytes first, the file we moved is identical
+            return self._acquire(digest), False
+        return obj, True
+
+    def put_staged(self, staged, ext):
+        obj, _ = self.put(staged.sha256.hexdigest(), ext, staged.size, staged.move_to)
+        return obj
+
+    def release(self, *object_ids):
+        counts = Counter(object_id for object_id in object_ids if object_id is not None)
+        by_count = {}
+        for object_id, n in counts.items():
+            by_count.setdefault(n, []).append(object_id)
+        now = datetime.now(timezone.utc)
+        for n, ids in by_count.items():
+            db.session.execute(
+                update(StoredObject).where(StoredObject.id.in_(ids))
+                .values(refcount=StoredObject.refcount - n, released_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+    def post_object_ids(self, post_ids):
+        if not post_ids:
+            return []
+        return list(db.session.scalars(
+            select(PostImage.object_id).where(PostImage.post_id.in_(post_ids), PostImage.object_id.isnot(None))
+        ))
+
+
+image_store = ImageStore()
+
+
+def _copy_to(source):
+    """A move_to for image_store.put that leaves source in place, so a failed commit loses nothing."""
+    def copy(path):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.link(source, tmp)
+        except OSError:
+            # Another filesystem, or one without hard links
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, path)
+    return copy
+
+
+def _migrate_file(legacy_path, report, discard):
+    size = os.path.getsize(legacy_path)
+    with open(legacy_path, 'rb') as f:
+        head = f.read(16)
+    # Named by what the bytes are, like new uploads, the legacy name only covers unknown formats
+    ext = sniff_extension(head) or os.path.splitext(legacy_path)[1].lower()
+    obj, created = image_store.put(file_digest(legacy_path), ext, size, _copy_to(legacy_path))
+
+    for variant_legacy in _legacy_variants(legacy_path):
+        variant_path = derivative_path(obj.path, os.path.splitext(variant_legacy)[0].rsplit('_', 1)[1])
+        if created and not os.path.exists(variant_path):
+            os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+            _copy_to(variant_legacy)(variant_path)
+        discard.append(variant_legacy)
+
+    if created:
+        report['stored'] += 1
+    else:
+        report['deduplicated'] += 1
+        report['bytes_saved'] += size
+    # Legacy files go only once the rows pointing at their copies are committed
+    discard.append(legacy_path)
+    has_variants = all(os.path.exists(derivative_path(obj.path, variant))
+                       for variant in current_app.config['THUMBNAIL_SIZES'])
+    return obj, has_variants
+
+
+def _legacy_variants(legacy_path):
+    folder, name = os.path.split(derivative_path(legacy_path, 'x'))
+    prefix = name[:-len('x.webp')]
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.startswith(prefix) and f.endswith('.webp')]
+
+
+def _remove_quietly(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def migrate_legacy_uploads(batch_size=200):
+    """Moves post images and avatars stored at fixed names into the object store.
+
+    Files are linked or copied in, the legacy copies are removed only after their batch committed.
+    """
+    report = Counter()
+    last_id = 0
+    while True:
+        images = PostImage.query.filter(PostImage.id > last_id, PostImage.object_id.is_(None)) \
+            .order_by(PostImage.id).limit(batch_size).all()
+        if not images:
+            break
+        discard, folders, post_ids = [], set(), set()
+        for image in images:
+            legacy_path = image.path
+            if not os.path.isfile(legacy_path):
+                report['missing'] += 1
+                continue
+            obj, image.has_variants = _migrate_file(legacy_path, report, discard)
+            image.object_id = obj.id
+            image.filename = obj.path
+            folders.add(os.path.dirname(legacy_path))
+            post_ids.add(image.post_id)
+        if post_ids:
+            # Image links of these posts changed, clients holding the old JSON must not get a 304
+            db.session.execute(update(Post).where(Post.id.in_(post_ids)).values(updated_at=datetime.now(timezone.utc)))
+        last_id = images[-1].id
+        db.session.commit()
+        _remove_quietly(discard)
+        for folder in folders:
+            # Post directories emptied by the move go away, anything unexpected in them stays
+            for path in (os.path.join(folder, DERIVED_DIR), folder):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+
+    last_id = 0
+    while True:
+        profiles = Profile.query.filter(Profile.id > last_id, Profile.img_path.isnot(None),
+                                        Profile.ava_object_id.is_(None)).order_by(Profile.id).limit(batch_size).all()
+        if not profiles:
+            break
+        discard = []
+        for profile in profiles:
+            if not os.path.isfile(profile.img_path):
+                report['missing'] += 1
+                continue
+            obj, profile.ava_variants = _migrate_file(profile.img_path, report, discard)
+            profile.ava_object_id = obj.id
+            profile.img_path = obj.path
+        last_id = profiles[-1].id
+        db.session.commit()
+        _remove_quietly(discard)
+    return report
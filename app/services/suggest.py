@@ -0,0 +1,148 @@
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+from sqlalchemy import select
+from ..extensions import db
+from ..models import Post
+from ..utils.periodic import Periodic
+from .search import tokenize
+import heapq
+import json
+import os
+import threading
+import time
+
+
+class SuggestIndex:
+    """Completes the last word typed into the search box from the words of post titles.
+
+    Terms live in a sorted list with a parallel list of how many titles use them, a prefix is one
+    bisect and a scan of at most SUGGEST_SCAN_LIMIT neighbours. Only the SUGGEST_MAX_TERMS most used
+    terms are kept. A background thread builds the index when the worker takes its first request and
+    refreshes it once it is SUGGEST_REFRESH_SECONDS old, requests never read titles themselves and get
+    no suggestions until the first build is in. With SUGGEST_SNAPSHOT_PATH set the built index is
+    written there and workers load it instead of reading every title while it is fresh, under gunicorn
+    --preload the master loads it once before forking. Writes update the answering worker's copy at
+    once, the other workers see them with their next refresh.
+    """
+
+    def __init__(self):
+        self.max_terms = 50000
+        self.min_prefix = 2
+        self.scan_limit = 2000
+        self.refresh_seconds = 300
+        self.snapshot_path = None
+        self._terms = []
+        self._counts = []
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._app = None
+        self._refresher = None
+
+    def init_app(self, app):
+        self.max_terms = app.config['SUGGEST_MAX_TERMS']
+        self.min_prefix = app.config['SUGGEST_MIN_PREFIX']
+        self.scan_limit = app.config['SUGGEST_SCAN_LIMIT']
+        self.refresh_seconds = app.config['SUGGEST_REFRESH_SECONDS']
+        self.snapshot_path = app.config['SUGGEST_SNAPSHOT_PATH']
+        self._app = app
+        # Wakes up more often than the index ages, so a refresh is never late by a whole period
+        self._refresher = Periodic('suggest-index', self._refresh, min(60, self.refresh_seconds))
+        # Only a file read, the database is not touched before gunicorn forks
+        self._load_snapshot()
+        app.before_request(self._refresher.start)
+
+    def _terms_of(self, title):
+        return {term for term in tokenize(title) if len(term) >= self.min_prefix}
+
+    def _install(self, terms, counts, built_at):
+        with self._lock:
+            self._terms, self._counts, self._built_at = terms, counts, built_at
+
+    def _load_snapshot(self):
+        if not self.snapshot_path:
+            return False
+        try:
+            age = time.time() - os.path.getmtime(self.snapshot_path)
+            if age > self.refresh_seconds:
+                return False
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f'Error while loading suggest snapshot: {e}')
+            return False
+        self._install(snapshot['terms'], snapshot['counts'], time.monotonic() - age)
+        return True
+
+    def rebuild(self):
+        usage = Counter()
+        for title in db.session.scalars(select(Post.title).execution_options(yield_per=1000)):
+            usage.update(self._terms_of(title))
+        kept = heapq.nlargest(self.max_terms, usage.items(), key=itemgetter(1)) \
+            if len(usage) > self.max_terms else usage.items()
+        kept = sorted(kept)
+        terms, counts = [term for term, _ in kept], [count for _, count in kept]
+        self._install(terms, counts, time.monotonic())
+
+        if self.snapshot_path:
+            try:
+                with open(self.snapshot_path + '.tmp', 'w') as f:
+                    json.dump({'terms': terms, 'counts': counts}, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(self.snapshot_path + '.tmp', self.snapshot_path)
+            except OSError as e:
+                print(f'Error while writing suggest snapshot: {e}')
+        return len(terms)
+
+    def _refresh(self):
+        if self._built_at is not None and time.monotonic() - self._built_at < self.refresh_seconds:
+            return
+        # Another worker may have rebuilt it already
+        if not self._load_snapshot():
+            with self._app.app_context():
+                self.rebuild()
+
+    def _change(self, term, delta):
+        i = bisect_left(self._terms, term)
+        if i < len(self._terms) and self._terms[i] == term:
+            self._counts[i] += delta
+            if self._counts[i] <= 0:
+                del self._terms[i], self._counts[i]
+        elif delta > 0 and len(self._terms) < self.max_terms:
+            # A full index takes new words at the next rebuild, if they are common enough by then
+            self._terms.insert(i, term)
+            self._counts.insert(i, delta)
+
+    def update(self, old_title=None, new_title=None):
+        if self._built_at is None:
+            return
+        try:
+            old, new = self._terms_of(old_title), self._terms_of(new_title)
+            with self._lock:
+                for term in old - new:
+                    self._change(term, -1)
+                for term in new - old:
+                    self._change(term, 1)
+        except Exception as e:
+            print(f'Error while updating suggest index: {e}')
+
+    def suggest(self, text, limit):
+        """Returns [(completed text, number of titles)] for the last word of text, most used first."""
+        words = tokenize(text)
+        # A trailing space means the last word is finished
+        if not words or text[-1:].isspace() or len(words[-1]) < self.min_prefix:
+            return []
+        prefix = words[-1]
+        with self._lock:
+            start = bisect_left(self._terms, prefix)
+            stop = min(start + self.scan_limit, len(self._terms))
+            end = bisect_left(self._terms, prefix + '\U0010ffff', start, stop)
+            candidates = list(zip(self._terms[start:end], self._counts[start:end]))
+        # Stable on ties, equally used terms stay in alphabetical order
+        top = heapq.nlargest(limit, candidates, key=itemgetter(1))
+        head = ' '.join(words[:-1])
+        return [(f'{head} {term}' if head else term, count) for term, count in top]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import update
+from ..extensions import db
+from ..models import Post, PostImage, Profile
+from .cache import response_cache
+from .identity import identity_cache
+import os
+import threading
+
+
+DERIVED_DIR = 'derived'
+
+
+def derivative_path(original_path, variant):
+    folder, name = os.path.split(original_path)
+    return os.path.join(folder, DERIVED_DIR, f'{os.path.splitext(name)[0]}_{variant}.webp')
+
+
+def render_derivatives(original_path, sizes, quality=80, overwrite=True):
+    if not overwrite and all(os.path.exists(derivative_path(original_path, variant)) for variant in sizes):
+        # Stored objects never change content, variants rendered for an earlier reference still fit
+        return
+    os.makedirs(os.path.join(os.path.dirname(original_path), DERIVED_DIR), exist_ok=True)
+    with Image.open(original_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+        for variant, size in sizes.items():
+            variant_img = img.copy()
+            variant_img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            path = derivative_path(original_path, variant)
+            # Shared objects can be rendered by two jobs at once, each writes its own temporary file
+            tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+            variant_img.save(tmp_path, 'WEBP', quality=quality, method=4)
+            os.replace(tmp_path, path)
+
+
+class DerivativePipeline:
+    """Renders resized WebP variants of uploaded images on a bounded background thread pool.
+
+    Jobs beyond THUMBNAIL_QUEUE_LIMIT are dropped rather than queued without bound,
+    the originals are served until 'flask regenerate-derivatives' catches up.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._slots = None
+
+    def init_app(self, app):
+        self.app = app
+        self._slots = threading.BoundedSemaphore(app.config['THUMBNAIL_QUEUE_LIMIT'])
+
+    def _get_executor(self):
+        # gunicorn forks workers after import, each one needs its own threads
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.app.config['THUMBNAIL_WORKERS'],
+                                                thread_name_prefix='derivatives')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            print(f'Derivative queue is full, skipping {fn.__name__}{args}')
+            return
+        app = current_app._get_current_object()
+
+        def job():
+            try:
+                with app.app_context():
+                    fn(*args)
+            except Exception as e:
+                print(f'Error while rendering derivatives {fn.__name__}{args}: {e}')
+            finally:
+                self._slots.release()
+
+        self._get_executor().submit(job)
+
+    def submit_post(self, post_id):
+        self._submit(self.render_post, post_id)
+
+    def submit_posts(self, post_ids):
+        # One job for a whole batch, bulk imports would overflow the queue one post at a time
+        self._submit(self.render_posts, list(post_ids))
+
+    def submit_avatar(self, user_id):
+        self._submit(self.render_avatar, user_id)
+
+    def render_post(self, post_id):
+        post = db.session.get(Post, post_id)
+        if not post:
+            return
+        for image in post.images:
+            render_derivatives(image.path, current_app.config['THUMBNAIL_SIZES'],
+                               current_app.config['THUMBNAIL_QUALITY'], overwrite=image.object_id is None)
+            image.has_variants = True
+        # Only image rows changed, the post's card links change with them
+        post.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+        response_cache.invalidate('post', post_id)
+        response_cache.invalidate_namespace('feed')
+
+    def render_posts(self, post_ids):
+        for post_id in post_ids:
+            try:
+                self.render_post(post_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f'Error while rendering derivatives of post {post_id}: {e}')
+
+    def render_avatar(self, user_id):
+        profile = Profile.query.filter_by(user_id=user_id).one_or_none()
+        if not profile or not profile.img_path:
+            return
+        render_derivatives(profile.img_path, current_app.config['THUMBNAIL_SIZES'],
+                           current_app.config['THUMBNAIL_QUALITY'], overwrite=profile.ava_object_id is None)
+        profile.ava_variants = True
+        db.session.commit()
+        identity_cache.invalidate(user_id)
+        response_cache.invalidate('profile', user_id)
+
+    def regenerate(self, batch_size=200):
+        rendered = failed = 0
+        last_id = 0
+        while True:
+            images = PostImage.query.filter(PostImage.id > last_id).order_by(PostImage.id).limit(batch_size).all()
+            if not images:
+                break
+            post_ids = set()
+            for image in images:
+                try:
+                    render_derivatives(image.path, current_app.config['THUMBNAIL_SIZES'],
+                                       current_app.config['THUMBNAIL_QUALITY'])
+                    image.has_variants = True
+                    post_ids.add(image.post_id)
+                    rendered += 1
+                except Exception as e:
+                    print(f'Error while rendering {image.filename} of post {image.post_id}: {e}')
+                    failed += 1
+            if post_ids:
+                # Like render_post, the card links of these posts may have changed
+                db.session.execute(update(Post).where(Post.id.in_(post_ids))
+                                   .values(updated_at=datetime.now(timezone.utc)))
+            last_id = images[-1].id
+            db.session.commit()
+            response_cache.invalidate('post', *post_ids)
+
+        user_ids = []
+        for profile in Profile.query.filter(Profile.img_path.isnot(None)).yield_per(batch_size):
+            try:
+                render_derivatives(profile.img_path, current_app.config['THUMBNAIL_SIZES'],
+                                   current_app.config['THUMBNAIL_QUALITY'])
+                profile.ava_variants = True
+                profile.updated_at = datetime.now(timezone.utc)
+                user_ids.append(profile.user_id)
+                rendered += 1
+            except Exception as e:
+                print(f'Error while rendering avatar of user {profile.user_id}: {e}')
+                failed += 1
+        db.session.commit()
+        identity_cache.invalidate(*user_ids)
+        response_cache.invalidate('profile', *user_ids)
+        response_cache.invalidate_namespace('feed')
+        return rendered, failed
+
+
+derivative_pipeline = DerivativePipeline()
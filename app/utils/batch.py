@@ -0,0 +1,19 @@
+class InvalidIdList(ValueError):
+    pass
+
+
+def parse_id_list(raw, limit):
+    if not raw:
+        raise InvalidIdList('ids parameter is required')
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidIdList('ids must be a comma separated list of integers')
+
+    # Duplicates are dropped, the first occurrence keeps its place
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise InvalidIdList('ids parameter is required')
+    if len(ids) > limit:
+        raise InvalidIdList(f'At most {limit} ids per request')
+    return ids
@@ -0,0 +1,15 @@
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(raw, allowed, default):
+    if raw is None:
+        return default
+    fields = {part.strip() for part in raw.split(',') if part.strip()}
+    if not fields:
+        return default
+    unknown = fields - set(allowed)
+    if unknown:
+        raise InvalidFields(f'Unknown fields: {", ".join(sorted(unknown))}, allowed: {", ".join(allowed)}')
+    # id is always returned, clients key their cards by it
+    return frozenset(fields | {'id'})
@@ -0,0 +1,25 @@
+from decimal import Decimal, InvalidOperation
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def parse_price(raw, name):
+    if raw is None or raw == '':
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise InvalidFilter(f'{name} must be a number')
+    if not value.is_finite() or value < 0:
+        raise InvalidFilter(f'{name} must be a positive number')
+    return value
+
+
+def parse_choice(raw, allowed, name, default):
+    if raw is None or raw == '':
+        return default
+    if raw not in allowed:
+        raise InvalidFilter(f'{name} must be one of: {", ".join(allowed)}')
+    return raw
@@ -0,0 +1,56 @@
+from flask.json.provider import DefaultJSONProvider
+from datetime import datetime, date, timezone
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Prices go out as JSON numbers and datetimes as ISO 8601. Naive datetimes coming from the database
+# are UTC and written as such ('2024-01-01T10:00:00Z'), aware ones keep their offset, which is what
+# orjson writes natively. The app itself only makes UTC ones.
+def _default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.isoformat().replace('+00:00', 'Z')
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Serializes with orjson when it is installed and with the stdlib otherwise, producing the same wire format."""
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def _orjson_options(self):
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self._indent():
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _indent(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            if not kwargs:
+                # The layout orjson writes, json.dumps would put spaces after separators
+                kwargs = {'indent': 2} if self._indent() else {'separators': (',', ':')}
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._orjson_options()).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._orjson_options()) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key, id, sort=None):
+    value = key.isoformat() if isinstance(key, datetime) else str(key)
+    # Cursors of the default order keep the original two-element form so issued ones stay valid
+    raw = json.dumps([value, id] if sort is None else [value, id, sort], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort=None, parse=datetime.fromisoformat):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, id, *rest = json.loads(raw)
+        if rest != ([sort] if sort is not None else []):
+            raise ValueError('cursor belongs to another sort order')
+        return parse(value), int(id)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+def get_page_size(requested, default, maximum):
+    try:
+        size = int(requested) if requested is not None else default
+    except (ValueError, TypeError):
+        size = default
+    return max(1, min(size, maximum))
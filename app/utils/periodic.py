@@ -0,0 +1,34 @@
+import os
+import threading
+import time
+
+
+class Periodic:
+    """Runs fn at once and then every interval seconds on a daemon thread, one thread per process.
+
+    start() is cheap and meant to be called from the request path, gunicorn forks its workers after
+    the app is created and a thread started before the fork does not exist in the children.
+    """
+
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+                self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            try:
+                self.fn()
+            except Exception as e:
+                print(f'Error while running {self.name}: {e}')
+            time.sleep(self.interval)
@@ -0,0 +1,91 @@
+from flask import Request, request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from functools import wraps
+import hashlib
+import os
+import tempfile
+
+
+FORM_FIELDS_ALLOWANCE = 64 * 1024
+
+
+def sniff_extension(head):
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+class StagedFile:
+    """File part written straight into the staging folder, rejected as soon as it grows past the limit."""
+
+    def __init__(self, folder, max_size):
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix='upload-', delete=False)
+        self.path = self._file.name
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.claimed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge(f'File exceeds {self.max_size / (1024*1024)} MB')
+        # Hashed while it streams in, the content-addressed store needs no second read
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def head(self, length=12):
+        self._file.seek(0)
+        data = self._file.read(length)
+        self._file.seek(0)
+        return data
+
+    def move_to(self, path):
+        self._file.close()
+        os.replace(self.path, path)
+        self.claimed = True
+
+    def discard(self):
+        self._file.close()
+        if not self.claimed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    max_file_size = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.max_file_size is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        staged = StagedFile(current_app.config['UPLOAD_STAGING_FOLDER'], self.max_file_size)
+        self.__dict__.setdefault('staged_files', []).append(staged)
+        return staged
+
+    def close(self):
+        super().close()
+        for staged in self.__dict__.get('staged_files', ()):
+            staged.discard()
+
+
+def upload_limits(max_file_size, max_total_size, max_files):
+    """Must run before the view touches request.form or request.files, parsing is lazy."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request.max_file_size = max_file_size
+            request.max_content_length = max_total_size + FORM_FIELDS_ALLOWANCE
+            request.max_form_parts = max_files + 16
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+"""Feed latency while scrapers saturate search, with and without admission control.
+
+The app runs under gunicorn sync workers as deployed, scrapers are told apart by X-Forwarded-For
+the way the platform's router reports them. Three runs are compared: the feed alone, the feed
+next to the scrapers with every request admitted, and the same with admission control on.
+
+    python -m benchmarks.admission                                   # local buckets, per-host slots
+    python -m benchmarks.admission --redis-url redis://localhost     # shared buckets and slots
+"""
+from app import create_app
+from app.config import Config
+from app.extensions import db, redis_client
+from .load.fakes import FakeRedis
+from .load.report import percentile
+from .load.seed import bench_config, seed, WORDS
+from .load.server import gunicorn_server
+from collections import Counter
+import argparse
+import os
+import random
+import requests
+import statistics
+import tempfile
+import threading
+import time
+
+
+def run(url, scraper_threads, feed_threads, duration, honor_retry_after):
+    stop = time.perf_counter() + duration
+    statuses, feed_latencies, search_latencies = Counter(), [], []
+
+    def scraper_loop(n):
+        # Every scraper comes from an address of its own, so only its own bucket runs dry
+        session = requests.Session()
+        session.headers['X-Forwarded-For'] = f'10.0.0.{n + 1}'
+        rng = random.Random(n)
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            r = session.get(f'{url}/api/posts/search/{rng.choice(WORDS)}/{rng.randint(1, 20)}')
+            search_latencies.append((time.perf_counter() - started) * 1000)
+            statuses[r.status_code] += 1
+            if honor_retry_after and r.status_code in (429, 503):
+                time.sleep(min(float(r.headers.get('Retry-After', 1)), max(stop - time.perf_counter(), 0)))
+
+    def feed_loop():
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            session.get(f'{url}/api/posts/feed')
+            feed_latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=scraper_loop, args=(n,)) for n in range(scraper_threads)]
+    threads += [threading.Thread(target=feed_loop) for _ in range(feed_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    search = f'{len(search_latencies) / duration:.1f} req/s, ' + \
+        ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())) if search_latencies else '-'
+    print(f'  search: {search}')
+    print(f'  feed: {len(feed_latencies) / duration:.1f} req/s, p50 {statistics.median(feed_latencies):.2f} ms, '
+          f'p95 {percentile(feed_latencies, 95):.2f} ms, p99 {percentile(feed_latencies, 99):.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.admission')
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn sync workers')
+    parser.add_argument('--scraper-threads', type=int, default=4)
+    parser.add_argument('--feed-threads', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--search-concurrency', type=int, default=os.cpu_count())
+    parser.add_argument('--ignore-retry-after', action='store_true', help='scrapers retry at once when rejected')
+    parser.add_argument('--redis-url', help='run with ADMISSION_SYNC=redis against this server')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # Upload paths are relative to the working directory, the server runs from folder too
+        os.chdir(folder)
+        try:
+            app = create_app(bench_config(folder))
+            redis_client.client = FakeRedis()
+            with app.app_context():
+                db.create_all()
+                seed(50, args.posts, 0, random.Random(1))
+                db.engine.dispose()
+        finally:
+            os.chdir(cwd)
+
+        # Searches running at once should not outnumber the cores the feed shares with them
+        classes = {**Config.ADMISSION_CLASSES,
+                   'search': {**Config.ADMISSION_CLASSES['search'], 'concurrency': args.search_concurrency}}
+        env = {'ADMISSION_SYNC': 'redis', 'REDIS_URL': args.redis_url} if args.redis_url else {'ADMISSION_SYNC': 'local'}
+        runs = (('feed alone', {}, 0), ('scrapers, every request admitted', {}, args.scraper_threads),
+                ('scrapers, admission control', Config.ADMISSION_ROUTES, args.scraper_threads))
+        for label, routes, scrapers in runs:
+            overrides = {'CACHE_ROUTES': {}, 'ADMISSION_ROUTES': routes, 'ADMISSION_CLASSES': classes,
+                         'ADMISSION_LOCK_DIR': os.path.join(folder, 'admission')}
+            with gunicorn_server(folder, args.workers, overrides, env) as url:
+                print(label)
+                run(url, scrapers, args.feed_threads, args.duration, not args.ignore_retry_after)
+
+
+if __name__ == '__main__':
+    main()
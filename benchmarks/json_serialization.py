@@ -0,0 +1,64 @@
+"""Serialization cost of post listings with the orjson provider against the stdlib one.
+
+    python -m benchmarks.json_serialization --repeat 200
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import Flask
+from app.utils import json_provider
+from app.utils.json_provider import FastJSONProvider
+import argparse
+import time
+
+
+def make_posts(count):
+    started = datetime(2025, 1, 1)
+    return [{
+        'id': i,
+        'creator_id': i % 97,
+        'title': f'Post title {i}',
+        'description': 'Gently used, pick up only. ' * 8,
+        'price': Decimal(f'{i * 3 % 10000}.{i % 100:02d}'),
+        'time': started + timedelta(minutes=i),
+        'location': 'Kyiv',
+        'image': f'uploads/posts/{i}/derived/post_image0_card.webp',
+        'thumbnail': f'uploads/posts/{i}/derived/post_image0_thumb.webp',
+        'img_path': [f'uploads/posts/{i}/post_image{n}.jpg' for n in range(3)]
+    } for i in range(count)]
+
+
+def measure(app, payload, repeat):
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = app.json.response({'posts': payload}).get_data()
+        return (time.perf_counter() - started) / repeat, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    orjson = json_provider.orjson
+    if orjson is None:
+        print('orjson is not installed, only the stdlib fallback is measured')
+
+    print(f'{"posts":>6} {"bytes":>9} {"stdlib ms":>10} {"orjson ms":>10} {"speedup":>8}')
+    for size in args.sizes:
+        payload = make_posts(size)
+        json_provider.orjson = None
+        stdlib, length = measure(app, payload, args.repeat)
+        json_provider.orjson = orjson
+        if orjson is not None:
+            fast, _ = measure(app, payload, args.repeat)
+            print(f'{size:>6} {length:>9} {stdlib * 1000:>10.3f} {fast * 1000:>10.3f} {stdlib / fast:>7.1f}x')
+        else:
+            print(f'{size:>6} {length:>9} {stdlib * 1000:>10.3f} {"-":>10} {"-":>8}')
+
+
+if __name__ == '__main__':
+    main()
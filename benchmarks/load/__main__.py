@@ -0,0 +1,130 @@
+"""Reproducible load benchmark of the API against SQLite (or a local MySQL) and an in-memory Redis.
+
+    python -m benchmarks.load --posts 5000 --duration 20 --output results.json
+    python -m benchmarks.load --posts 5000 --duration 20 --baseline results.json --tolerance 0.2
+
+With --baseline the run exits with status 1 when any endpoint regressed beyond the tolerance.
+"""
+from app import create_app
+from app.extensions import db, redis_client
+from app.models import PostImage
+from flask_jwt_extended import create_access_token
+from .fakes import FakeRedis
+from .report import summarize, print_table, compare
+from .seed import bench_config, seed
+from .workloads import Workloads, DEFAULT_MIX
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+def parse_mix(raw):
+    if not raw:
+        return DEFAULT_MIX
+    mix = {}
+    for part in raw.split(','):
+        name, weight = part.split('=')
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f'Unknown workload {name}, choose from {", ".join(DEFAULT_MIX)}')
+        mix[name] = int(weight)
+    return mix
+
+
+def prepare(app, args, rng):
+    with app.app_context():
+        db.create_all()
+        user_ids = seed(args.users, args.posts, args.images_per_post, rng)
+        tokens = [create_access_token(identity=str(user_id)) for user_id in user_ids[:20]]
+        image_paths = [f'{img.post.img_path}/{img.filename}' for img in PostImage.query.limit(200)]
+
+    # Walking the feed once gives cursors spread over the whole data set
+    client = app.test_client()
+    cursors, cursor = [], None
+    while True:
+        body = client.get('/api/posts/feed', query_string={'cursor': cursor, 'limit': 50} if cursor else {'limit': 50}).get_json()
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+        cursors.append(cursor)
+    return tokens, cursors or [None], image_paths
+
+
+def run(app, args, mix, tokens, cursors, image_paths):
+    latencies = {name: [] for name in mix}
+    errors = {}
+    names, weights = list(mix), list(mix.values())
+    stop = time.perf_counter() + args.duration
+
+    def worker(seed_):
+        rng = random.Random(seed_)
+        workloads = Workloads(app.test_client(), rng, args.users, args.posts, tokens, cursors, image_paths)
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            status = getattr(workloads, name)()
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            if status >= 500:
+                errors[name] = errors.get(name, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--images-per-post', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--mix', help='weights like feed=30,search=10, defaults to a mixed read-heavy load')
+    parser.add_argument('--database-url', help='e.g. a local MySQL container, defaults to a temporary SQLite file')
+    parser.add_argument('--with-cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # Upload paths are relative to the working directory
+        os.chdir(folder)
+        try:
+            config = bench_config(folder, args.database_url)
+            if not args.with_cache:
+                config.CACHE_ROUTES = {}
+            app = create_app(config)
+            redis_client.client = FakeRedis()
+
+            tokens, cursors, image_paths = prepare(app, args, rng)
+            results = run(app, args, mix, tokens, cursors, image_paths)
+        finally:
+            os.chdir(cwd)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from redis.exceptions import ConnectionError
+import threading
+
+
+class FakeRedis:
+    """In-memory stand-in for the handful of Redis commands the app uses.
+
+    Lua scripts are not run, calling one raises ConnectionError and the app takes its Redis outage
+    path. tests/ use fakeredis, which runs them.
+    """
+
+    def __init__(self):
+        self._kv = {}
+        self._zsets = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._kv.get(key)
+
+    def set(self, key, value, ex=None):
+        self._kv[key] = value
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            self._kv[key] = int(self._kv.get(key, 0)) + 1
+            return self._kv[key]
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum((self._kv.pop(key, None) is not None) + (self._zsets.pop(key, None) is not None)
+                       for key in keys)
+
+    def exists(self, *keys):
+        return sum(key in self._kv or key in self._zsets for key in keys)
+
+    def expire(self, key, seconds):
+        return self.exists(key)
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            self._zsets.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    def zrem(self, key, *members):
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            return sum(zset.pop(member, None) is not None for member in members)
+
+    def zcard(self, key):
+        return len(self._zsets.get(key, {}))
+
+    def zremrangebyscore(self, key, low, high):
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            removed = [m for m, score in zset.items() if float(low) <= score <= float(high)]
+            for member in removed:
+                del zset[member]
+        return len(removed)
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        low = float('-inf') if low == '-inf' else float(low)
+        high = float('inf') if high == '+inf' else float(high)
+        items = sorted(((m, s) for m, s in self._zsets.get(key, {}).items() if low <= s <= high),
+                       key=lambda item: item[1])
+        return items if withscores else [m for m, _ in items]
+
+    def register_script(self, script):
+        def run(keys=None, args=None):
+            raise ConnectionError('FakeRedis does not run scripts')
+        return run
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in commands]
@@ -0,0 +1,47 @@
+import json
+import statistics
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(latencies, errors, duration):
+    results = {}
+    for name, values in sorted(latencies.items()):
+        results[name] = {
+            'requests': len(values),
+            'errors': errors.get(name, 0),
+            'throughput': round(len(values) / duration, 2),
+            'p50_ms': round(statistics.median(values), 3) if values else 0.0,
+            'p95_ms': round(percentile(values, 95), 3),
+            'p99_ms': round(percentile(values, 99), 3)
+        }
+    return results
+
+
+def print_table(results):
+    print(f'{"endpoint":<14}{"req":>8}{"err":>6}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for name, r in results.items():
+        print(f'{name:<14}{r["requests"]:>8}{r["errors"]:>6}{r["throughput"]:>10.1f}'
+              f'{r["p50_ms"]:>10.2f}{r["p95_ms"]:>10.2f}{r["p99_ms"]:>10.2f}')
+
+
+def compare(results, baseline_path, tolerance):
+    """Regressions are endpoints whose p95 grew or throughput dropped by more than tolerance."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base['p95_ms'] and current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {base["p95_ms"]:.2f} -> {current["p95_ms"]:.2f} ms')
+        if base['throughput'] and current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{name}: throughput {base["throughput"]:.1f} -> {current["throughput"]:.1f} req/s')
+    return regressions
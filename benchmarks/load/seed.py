@@ -0,0 +1,72 @@
+from app.config import Config
+from app.extensions import db
+from app.models import User, Profile, Post, PostImage
+from app.services.passwords import password_hasher
+from datetime import datetime, timedelta
+from PIL import Image
+import io
+import os
+
+
+WORDS = ('phone', 'bicycle', 'sofa', 'laptop', 'jacket', 'guitar', 'camera', 'table', 'lamp', 'boots',
+         'vintage', 'new', 'used', 'cheap', 'red', 'black', 'large', 'small', 'wooden', 'leather')
+CITIES = ('Kyiv', 'Lviv', 'Odesa', 'Kharkiv', 'Dnipro')
+PASSWORD = 'benchmark'
+
+
+def bench_config(folder, database_url=None):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///' + os.path.join(folder, 'bench.db')
+        UPLOAD_FOLDER = os.path.join(folder, 'uploads')
+        UPLOAD_STAGING_FOLDER = os.path.join(folder, 'uploads', 'staging')
+        METRICS_MULTIPROC_DIR = None
+        SLOW_REQUEST_MS = None
+        # One client address drives every workload, benchmarks measure endpoint cost and not shedding
+        ADMISSION_ROUTES = {}
+        # Benchmarks run without a Redis server unless they ask for one
+        PASSWORD_HASH_GLOBAL_LIMIT = None
+    return BenchConfig
+
+
+def sample_image(size=(800, 600)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+
+def seed(users, posts, images_per_post, rng):
+    """Creates the data set inside the current app context, relative to the current directory."""
+    password = password_hasher.hash(PASSWORD)
+    image = sample_image()
+    base = datetime(2024, 1, 1)
+
+    user_ids = []
+    for i in range(users):
+        user = User(email=f'user{i}@bench', password=password)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Profile(user_id=user.id, name='Bench', surname='User', location=rng.choice(CITIES)))
+        user_ids.append(user.id)
+    db.session.commit()
+
+    for start in range(0, posts, 500):
+        batch = []
+        for i in range(start, min(start + 500, posts)):
+            title = ' '.join(rng.sample(WORDS, 3))
+            batch.append(Post(creator_id=rng.choice(user_ids), title=title, price=rng.randint(1, 10000),
+                              description=' '.join(rng.choices(WORDS, k=40)),
+                              creation_date=base + timedelta(minutes=i)))
+        db.session.add_all(batch)
+        db.session.flush()
+
+        for post in batch:
+            post.img_path = os.path.join('uploads', 'posts', str(post.id))
+            os.makedirs(post.img_path, exist_ok=True)
+            for position in range(1, images_per_post + 1):
+                filename = f'post_image{position}.jpg'
+                with open(os.path.join(post.img_path, filename), 'wb') as f:
+                    f.write(image)
+                db.session.add(PostImage(post_id=post.id, position=position, filename=filename))
+        db.session.commit()
+
+    return user_ids
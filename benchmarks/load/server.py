@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WSGI_MODULE = '''from app import create_app
+from benchmarks.load.seed import bench_config
+
+config = bench_config({folder!r})
+{overrides}
+app = create_app(config)
+'''
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def gunicorn_server(folder, workers, overrides=None, env=None, startup_timeout=30):
+    """Runs the app on the data set in folder under gunicorn sync workers like the Procfile, yields its URL.
+
+    overrides are set on bench_config and must be literals, env is added to the workers' environment.
+    """
+    with open(os.path.join(folder, 'bench_wsgi.py'), 'w') as f:
+        f.write(WSGI_MODULE.format(folder=folder, overrides='\n'.join(
+            f'config.{name} = {value!r}' for name, value in (overrides or {}).items())))
+
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    with open(os.path.join(folder, 'gunicorn.log'), 'w') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'bench_wsgi:app'],
+            cwd=folder, stdout=log, stderr=subprocess.STDOUT,
+            env={**os.environ, 'PYTHONPATH': os.pathsep.join((ROOT, folder)), **(env or {})}
+        )
+        try:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                try:
+                    urllib.request.urlopen(url + '/api/posts/feed', timeout=1).close()
+                    break
+                except OSError:
+                    if proc.poll() is not None or time.monotonic() > deadline:
+                        raise SystemExit(f'gunicorn did not start, see {log.name}')
+                    time.sleep(0.2)
+            yield url
+        finally:
+            proc.terminate()
+            proc.wait(10)
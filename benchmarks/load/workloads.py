@@ -0,0 +1,50 @@
+from .seed import WORDS, PASSWORD, sample_image
+import io
+
+
+class Workloads:
+    """One callable per benchmarked endpoint, each returns the response status code."""
+
+    def __init__(self, client, rng, users, posts, tokens, deep_cursors, image_paths):
+        self.client = client
+        self.rng = rng
+        self.users = users
+        self.posts = posts
+        self.tokens = tokens
+        self.deep_cursors = deep_cursors
+        self.image_paths = image_paths
+        self.upload_bytes = sample_image((400, 300))
+
+    def feed(self):
+        return self.client.get('/api/posts/feed').status_code
+
+    def deep_page(self):
+        return self.client.get(f'/api/posts/page/{self.rng.randint(1, max(1, self.posts // 10))}').status_code
+
+    def deep_cursor(self):
+        return self.client.get('/api/posts/feed', query_string={'cursor': self.rng.choice(self.deep_cursors)}).status_code
+
+    def search(self):
+        return self.client.get(f'/api/posts/search/{self.rng.choice(WORDS)}/1').status_code
+
+    def detail(self):
+        return self.client.get(f'/api/posts/{self.rng.randint(1, self.posts)}').status_code
+
+    def image(self):
+        return self.client.get(f'/api/posts/get-image/{self.rng.choice(self.image_paths)}').status_code
+
+    def login(self):
+        email = f'user{self.rng.randrange(self.users)}@bench'
+        return self.client.post('/api/auth/login', json={'email': email, 'password': PASSWORD}).status_code
+
+    def create_post(self):
+        data = {'title': 'Benchmark listing', 'price': '100', 'description': 'created by the load benchmark',
+                'files': [(io.BytesIO(self.upload_bytes), 'photo.jpg')]}
+        return self.client.post('/api/posts/create-post', data=data, content_type='multipart/form-data',
+                                headers={'Authorization': f'Bearer {self.rng.choice(self.tokens)}'}).status_code
+
+
+DEFAULT_MIX = {
+    'feed': 30, 'deep_page': 5, 'deep_cursor': 10, 'search': 15, 'detail': 20, 'image': 15, 'login': 3,
+    'create_post': 2
+}
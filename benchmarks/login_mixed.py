@@ -0,0 +1,90 @@
+"""Login throughput against feed latency under mixed load, with hashing inline or in the process pool.
+
+The app runs under gunicorn sync workers as deployed, each with its own hash pool.
+
+    python -m benchmarks.login_mixed --hash-workers 0    # hash inside the request worker
+    python -m benchmarks.login_mixed --hash-workers 2    # hash in each worker's bounded process pool
+    python -m benchmarks.login_mixed --redis-url redis://localhost    # with the limit shared across workers
+"""
+from app import create_app
+from app.extensions import db, redis_client
+from .load.fakes import FakeRedis
+from .load.report import percentile
+from .load.seed import bench_config, seed, PASSWORD
+from .load.server import gunicorn_server
+from collections import Counter
+import argparse
+import os
+import random
+import requests
+import statistics
+import tempfile
+import threading
+import time
+
+
+USERS = 20
+
+
+def run(url, login_threads, feed_threads, duration):
+    stop = time.perf_counter() + duration
+    statuses, feed_latencies = Counter(), []
+
+    def login_loop(n):
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            r = session.post(f'{url}/api/auth/login', json={'email': f'user{n % USERS}@bench', 'password': PASSWORD})
+            statuses[r.status_code] += 1
+
+    def feed_loop():
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            session.get(f'{url}/api/posts/feed')
+            feed_latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=login_loop, args=(n,)) for n in range(login_threads)]
+    threads += [threading.Thread(target=feed_loop) for _ in range(feed_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f'logins: {statuses[200] / duration:.1f}/s, '
+          f'{", ".join(f"{status}: {count}" for status, count in sorted(statuses.items()))}')
+    print(f'feed: {len(feed_latencies) / duration:.1f} req/s, p50 {statistics.median(feed_latencies):.2f} ms, '
+          f'p95 {percentile(feed_latencies, 95):.2f} ms, p99 {percentile(feed_latencies, 99):.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.login_mixed')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn sync workers')
+    parser.add_argument('--hash-workers', type=int, default=2, help='PASSWORD_HASH_WORKERS, 0 hashes inline')
+    parser.add_argument('--login-threads', type=int, default=4)
+    parser.add_argument('--feed-threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--redis-url', help='count hashes in flight across workers on this server')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            app = create_app(bench_config(folder))
+            redis_client.client = FakeRedis()
+            with app.app_context():
+                db.create_all()
+                seed(USERS, 200, 0, random.Random(1))
+                db.engine.dispose()
+        finally:
+            os.chdir(cwd)
+
+        overrides = {'CACHE_ROUTES': {}, 'PASSWORD_HASH_WORKERS': args.hash_workers,
+                     'PASSWORD_HASH_GLOBAL_LIMIT': 16 if args.redis_url else None}
+        env = {'REDIS_URL': args.redis_url} if args.redis_url else {}
+        with gunicorn_server(folder, args.workers, overrides, env) as url:
+            run(url, args.login_threads, args.feed_threads, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Throughput of the derivative pipeline per core.
+
+    python -m benchmarks.thumbnails --images 40 --width 2400 --height 1800
+"""
+from concurrent.futures import ProcessPoolExecutor
+from app.config import Config
+from app.services.thumbnails import render_derivatives
+from PIL import Image
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def make_images(folder, count, width, height):
+    paths = []
+    for i in range(count):
+        # Noise keeps the JPEG close to the size of a real photo
+        img = Image.frombytes('RGB', (width, height), random.randbytes(width * height * 3))
+        path = os.path.join(folder, f'post_image{i}.jpg')
+        img.save(path, 'JPEG', quality=90)
+        paths.append(path)
+    return paths
+
+
+def render(path):
+    render_derivatives(path, Config.THUMBNAIL_SIZES, Config.THUMBNAIL_QUALITY)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--width', type=int, default=2400)
+    parser.add_argument('--height', type=int, default=1800)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_images(folder, args.images, args.width, args.height)
+        print(f'{args.images} images {args.width}x{args.height}, sizes {Config.THUMBNAIL_SIZES}')
+
+        workers = 1
+        while workers <= args.max_workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                started = time.perf_counter()
+                list(pool.map(render, paths))
+                elapsed = time.perf_counter() - started
+            rate = args.images / elapsed
+            print(f'workers={workers:<3} {rate:8.1f} images/s  {rate / workers:8.1f} images/s per core')
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""baseline schema
+
+The tables as db.create_all() made them before migrations were added. Databases created that way
+are already at this revision, mark them with `flask db stamp 0001` and then upgrade.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 08:54:30.306366
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password', sa.String(length=256), nullable=False),
+    sa.Column('reg_datetime', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('posts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=80), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('description', sa.String(length=1500), nullable=True),
+    sa.Column('img_path', sa.String(length=255), nullable=True),
+    sa.Column('creation_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=True),
+    sa.Column('surname', sa.String(length=50), nullable=True),
+    sa.Column('age', sa.Integer(), nullable=True),
+    sa.Column('bio', sa.String(length=500), nullable=True),
+    sa.Column('phone_number', sa.String(length=14), nullable=True),
+    sa.Column('location', sa.String(length=100), nullable=True),
+    sa.Column('img_path', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('profiles')
+    op.drop_table('posts')
+    op.drop_table('users')
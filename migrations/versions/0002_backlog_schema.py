@@ -0,0 +1,112 @@
+"""feed indexes, post images, object store, version stamps
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 08:54:34.622061
+
+Existing rows get Post.location copied from the seller's profile and version stamps set to
+the post's creation date, or to the time of the upgrade for profiles. The post_images rows of
+existing posts come from their upload directories, run `flask backfill-post-images` after this.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+VersionStamp = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
+
+def upgrade():
+    op.create_table('stored_objects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('ext', sa.String(length=8), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('released_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('digest')
+    )
+    with op.batch_alter_table('stored_objects', schema=None) as batch_op:
+        batch_op.create_index('ix_stored_objects_refcount_released_at', ['refcount', 'released_at'], unique=False)
+
+    op.create_table('post_images',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('has_variants', sa.Boolean(), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['object_id'], ['stored_objects.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('post_id', 'position', name='uq_post_images_post_position')
+    )
+    with op.batch_alter_table('post_images', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_post_images_object_id'), ['object_id'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('location', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', VersionStamp, nullable=True))
+        batch_op.create_index('ix_posts_creation_date_id_price', ['creation_date', 'id', 'price'], unique=False)
+        batch_op.create_index('ix_posts_creator_id_creation_date_id', ['creator_id', 'creation_date', 'id'], unique=False)
+        batch_op.create_index('ix_posts_location_creation_date_id_price', ['location', 'creation_date', 'id', 'price'], unique=False)
+        batch_op.create_index('ix_posts_location_price_id', ['location', 'price', 'id'], unique=False)
+        batch_op.create_index('ix_posts_price_id', ['price', 'id'], unique=False)
+    if op.get_context().dialect.name == 'mysql':
+        # Search uses MATCH ... AGAINST on MySQL only, other databases search in memory
+        op.create_index('ix_posts_title_description_fulltext', 'posts', ['title', 'description'],
+                        unique=False, mysql_prefix='FULLTEXT')
+
+    with op.batch_alter_table('profiles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ava_variants', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('ava_object_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', VersionStamp, nullable=True))
+        batch_op.create_foreign_key('fk_profiles_ava_object_id_stored_objects', 'stored_objects',
+                                    ['ava_object_id'], ['id'])
+
+    # The model sets the default, the server one only had to fill the existing rows
+    with op.batch_alter_table('profiles', schema=None) as batch_op:
+        batch_op.alter_column('ava_variants', existing_type=sa.Boolean(), existing_nullable=False,
+                              server_default=None)
+
+    op.execute('UPDATE posts SET location = '
+               '(SELECT profiles.location FROM profiles WHERE profiles.user_id = posts.creator_id)')
+    op.execute('UPDATE posts SET updated_at = creation_date')
+    op.execute(sa.text('UPDATE profiles SET updated_at = CURRENT_TIMESTAMP'))
+
+
+def downgrade():
+    with op.batch_alter_table('profiles', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_profiles_ava_object_id_stored_objects', type_='foreignkey')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('ava_object_id')
+        batch_op.drop_column('ava_variants')
+
+    if op.get_context().dialect.name == 'mysql':
+        op.drop_index('ix_posts_title_description_fulltext', table_name='posts')
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_price_id')
+        batch_op.drop_index('ix_posts_location_price_id')
+        batch_op.drop_index('ix_posts_location_creation_date_id_price')
+        batch_op.drop_index('ix_posts_creator_id_creation_date_id')
+        batch_op.drop_index('ix_posts_creation_date_id_price')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('location')
+
+    with op.batch_alter_table('post_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_images_object_id'))
+
+    op.drop_table('post_images')
+    with op.batch_alter_table('stored_objects', schema=None) as batch_op:
+        batch_op.drop_index('ix_stored_objects_refcount_released_at')
+
+    op.drop_table('stored_objects')
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from app import create_app
+from app.config import Config
+from app.extensions import db, redis_client
+from app.models import User, Profile, Post, PostImage
+import fakeredis
+import os
+import pytest
+
+
+CITIES = ('Kyiv', 'Lviv', 'Odesa', 'Kharkiv', 'Dnipro')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('app')
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(folder / 'test.db')
+        UPLOAD_FOLDER = str(folder / 'uploads')
+        UPLOAD_STAGING_FOLDER = str(folder / 'uploads' / 'staging')
+        METRICS_MULTIPROC_DIR = None
+        SLOW_REQUEST_MS = None
+        PASSWORD_HASH_WORKERS = 0
+        PASSWORD_HASH_GLOBAL_LIMIT = None
+        ADMISSION_ROUTES = {}
+        ADMISSION_SYNC = 'local'
+        ADMISSION_LOCK_DIR = str(folder / 'admission')
+        CACHE_ROUTES = {}
+
+    # Upload paths are relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        app = create_app(TestConfig)
+        with app.app_context():
+            db.create_all()
+            yield app
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """An empty Redis that runs Lua scripts, for each test."""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, 'client', client)
+    return client
+
+
+@pytest.fixture
+def add_posts(app):
+    """Adds n posts spread over a few sellers, cities and prices, returns the ids of the sellers.
+
+    Every test using it starts from empty tables.
+    """
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    base = datetime(2024, 1, 1)
+
+    def add(n, sellers=5, images=0):
+        users = User.query.order_by(User.id).limit(sellers).all()
+        for i in range(len(users), sellers):
+            user = User(email=f'seller{i}@test', password='-')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Profile(user_id=user.id, name='Seller', location=CITIES[i % len(CITIES)]))
+            users.append(user)
+        start = db.session.query(Post).count()
+        posts = [
+            Post(creator_id=users[i % sellers].id, title=f'Post number {i}', price=(i * 37) % 5000 + 1,
+                 description='a post made by the test suite', location=CITIES[i % len(CITIES)],
+                 creation_date=base + timedelta(minutes=i))
+            for i in range(start, start + n)
+        ]
+        db.session.add_all(posts)
+        db.session.flush()
+        for post in posts:
+            post.img_path = os.path.join('uploads', 'posts', str(post.id))
+            db.session.add_all([PostImage(post_id=post.id, position=position, filename=f'post_image{position}.jpg')
+                                for position in range(1, images + 1)])
+        db.session.commit()
+        return [user.id for user in users]
+
+    return add
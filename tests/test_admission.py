@@ -0,0 +1,82 @@
+from app.extensions import redis_client
+from app.services.admission import CostClass, admission_control
+from collections import OrderedDict
+import fakeredis
+import pytest
+import time
+
+
+@pytest.fixture
+def feed_class(monkeypatch, tmp_path):
+    # Two requests of burst, one at a time, for the feed only
+    cost_class = CostClass('test', rate=1, burst=2, concurrency=1, slot_lease=30, lock_dir=str(tmp_path))
+    monkeypatch.setattr(admission_control, 'classes', {'test': cost_class})
+    monkeypatch.setattr(admission_control, 'routes', {'posts.get_feed': 'test'})
+    monkeypatch.setattr(admission_control, '_buckets', OrderedDict())
+    monkeypatch.setattr(admission_control, '_bucket_script', None)
+    return cost_class
+
+
+def get_feed(client, addr='10.0.0.1'):
+    return client.get('/api/posts/feed', environ_base={'REMOTE_ADDR': addr})
+
+
+def assert_bucket_limits(client):
+    assert get_feed(client).status_code == 200
+    assert get_feed(client).status_code == 200
+    rejected = get_feed(client)
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After'] == '1'
+    # Every client has a bucket of its own
+    assert get_feed(client, '10.0.0.2').status_code == 200
+
+
+def test_local_bucket(client, feed_class):
+    assert_bucket_limits(client)
+
+
+def test_local_slots(client, feed_class):
+    admitted, token = feed_class.local_slots.acquire()
+    assert admitted
+    try:
+        busy = get_feed(client)
+        assert busy.status_code == 503
+        assert 'Retry-After' in busy.headers
+    finally:
+        feed_class.local_slots.release(token)
+    assert get_feed(client).status_code == 200
+    # The request gave its slot back on teardown
+    admitted, token = feed_class.local_slots.acquire()
+    assert admitted
+    feed_class.local_slots.release(token)
+
+
+def test_redis_bucket(client, feed_class, fake_redis, monkeypatch):
+    monkeypatch.setattr(admission_control, 'sync', 'redis')
+    assert_bucket_limits(client)
+    assert fake_redis.exists('admission:test:10.0.0.1')
+    assert not admission_control._buckets
+
+
+def test_redis_slots(client, feed_class, fake_redis, monkeypatch):
+    monkeypatch.setattr(admission_control, 'sync', 'redis')
+    key = feed_class.redis_slots.key
+    fake_redis.zadd(key, {'other-host': time.time()})
+    assert get_feed(client).status_code == 503
+    # A slot older than the lease was left behind by a dead worker and no longer counts
+    fake_redis.zadd(key, {'other-host': time.time() - 31})
+    assert get_feed(client).status_code == 200
+    assert fake_redis.zcard(key) == 0
+
+
+def test_redis_error_falls_back_to_local(client, feed_class, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, 'client', fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(admission_control, 'sync', 'redis')
+    admitted, token = feed_class.local_slots.acquire()
+    try:
+        assert get_feed(client, '10.0.0.3').status_code == 503
+    finally:
+        feed_class.local_slots.release(token)
+    assert_bucket_limits(client)
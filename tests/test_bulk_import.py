@@ -0,0 +1,42 @@
+from flask_jwt_extended import create_access_token
+from app.extensions import db
+from app.models import Post, PostImage
+from app.services.thumbnails import derivative_pipeline
+import io
+import json
+import zipfile
+
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'
+
+
+def test_imported_posts_get_their_own_images(app, client, add_posts, monkeypatch):
+    # The images are not real JPEGs, there is nothing to render
+    monkeypatch.setattr(derivative_pipeline, 'submit_posts', lambda post_ids: None)
+    # The seller already has posts under the titles being imported
+    seller = add_posts(2, sellers=1)[0]
+    titles = [post.title for post in Post.query.order_by(Post.id)]
+    with app.test_request_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=str(seller))}
+    rows = [{'title': title, 'description': 'imported by the test suite', 'price': 10 + i, 'images': [f'{i}.jpg']}
+            for i, title in enumerate(titles + titles)]
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for i in range(len(rows)):
+            zf.writestr(f'{i}.jpg', JPEG + bytes([i]) * 32)
+    archive.seek(0)
+
+    response = client.post('/api/posts/import', headers=headers, data={
+        'rows': (io.BytesIO('\n'.join(json.dumps(row) for row in rows).encode()), 'rows.jsonl'),
+        'images': (archive, 'images.zip')
+    })
+
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    created = [result for result in results if result.get('status') == 'created']
+    assert len(created) == len(rows)
+    for i, result in enumerate(created):
+        post = db.session.get(Post, result['post_id'])
+        assert post.price == 10 + i
+        image, = PostImage.query.filter_by(post_id=post.id).all()
+        with open(image.path, 'rb') as f:
+            assert f.read() == JPEG + bytes([i]) * 32
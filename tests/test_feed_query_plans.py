@@ -0,0 +1,13 @@
+from app.services.query_plans import feed_query_plans
+
+
+def test_feed_queries_read_pages_off_an_index(app, add_posts):
+    add_posts(500)
+    plans = list(feed_query_plans())
+    assert plans
+
+    full_scans = [label for label, plan in plans if plan.full_scan]
+    assert not full_scans, f'full table scans: {full_scans}'
+    # Keyset pages must come out of the index in order, a filesort reads every match before the first row
+    filesorts = [label for label, plan in plans if plan.filesort]
+    assert not filesorts, f'sorted in memory: {filesorts}'
@@ -0,0 +1,48 @@
+from app.extensions import db, redis_client
+from app.models import Profile
+from app.services.identity import IdentityCache
+import fakeredis
+
+
+def rename(user_id, name):
+    Profile.query.filter_by(user_id=user_id).update({'name': name})
+    db.session.commit()
+
+
+def test_invalidation_reaches_other_workers(add_posts):
+    seller = add_posts(1, sellers=1)[0]
+    first, second = IdentityCache(), IdentityCache()
+    assert first.get(seller).profile.name == 'Seller'
+
+    rename(seller, 'Renamed')
+    # Handled by the other worker, the first one still holds its snapshot until it pulls
+    second.invalidate(seller)
+    assert first.get(seller).profile.name == 'Seller'
+    first.sync()
+    assert first.get(seller).profile.name == 'Renamed'
+    # Applied once, later pulls within the skew window keep the new snapshot
+    first.sync()
+    assert seller in first._entries
+
+
+def test_snapshots_are_bypassed_while_redis_is_unreachable(add_posts, monkeypatch):
+    seller = add_posts(1, sellers=1)[0]
+    cache = IdentityCache()
+    cache.get(seller)
+
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, 'client', fakeredis.FakeRedis(server=server, decode_responses=True))
+    rename(seller, 'Renamed')
+    cache._synced_at -= cache.max_staleness + 1
+    cache._next_sync = 0
+    assert cache.get(seller).profile.name == 'Renamed'
+
+
+def test_a_full_cache_drops_only_its_oldest_snapshots(add_posts):
+    sellers = add_posts(11, sellers=11)
+    cache = IdentityCache()
+    cache.max_entries = 10
+    for seller in sellers:
+        cache.get(seller)
+    assert list(cache._entries) == sellers[1:]
@@ -0,0 +1,29 @@
+import os
+import pytest
+
+
+def put(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8\xff' + b'\x00' * 32)
+    return path
+
+
+def test_stored_objects_are_immutable(client):
+    response = client.get('/api/posts/get-image/' + put('uploads/objects/ab/cd/abcd.jpg'))
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+
+
+@pytest.mark.parametrize('path', ['uploads/objects/ab/cd/derived/abcd_thumb.webp', 'uploads/posts/1/post_image1.jpg'])
+def test_rewritable_files_are_revalidated(client, path):
+    response = client.get('/api/posts/get-image/' + put(path))
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+    assert response.cache_control.no_cache
+
+
+@pytest.mark.parametrize('url', ['uploads/staging/upload-1', 'uploads/./staging/upload-1', 'uploads//staging/upload-1'])
+def test_staged_uploads_are_not_served(app, client, url):
+    put(os.path.join(app.config['UPLOAD_STAGING_FOLDER'], 'upload-1'))
+    assert client.get('/api/posts/get-image/' + url).status_code == 404
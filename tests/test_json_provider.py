@@ -0,0 +1,31 @@
+from datetime import datetime, date, timezone, timedelta
+from decimal import Decimal
+from app.utils import json_provider
+import pytest
+
+
+PAYLOAD = {
+    'price': Decimal('1250.50'),
+    'naive': datetime(2024, 1, 1, 10, 0, 0, 123456),
+    'aware': datetime(2024, 1, 1, 13, 0, tzinfo=timezone(timedelta(hours=3))),
+    'day': date(2024, 1, 1),
+    'title': 'Велосипед',
+    'nested': [{'b': 1, 'a': None}, True],
+}
+
+
+@pytest.mark.parametrize('compact', [None, False])
+def test_stdlib_fallback_writes_the_same_bytes(app, monkeypatch, compact):
+    monkeypatch.setattr(app.json, 'compact', compact)
+    fast = app.json.dumps(PAYLOAD)
+    with app.test_request_context():
+        fast_response = app.json.response(PAYLOAD).get_data()
+        monkeypatch.setattr(json_provider, 'orjson', None)
+        assert app.json.dumps(PAYLOAD) == fast
+        assert app.json.response(PAYLOAD).get_data() == fast_response
+
+
+def test_naive_datetimes_are_sent_as_utc(app):
+    assert '"naive":"2024-01-01T10:00:00.123456Z"' in app.json.dumps(PAYLOAD)
+    assert '"aware":"2024-01-01T13:00:00+03:00"' in app.json.dumps(PAYLOAD)
+    assert app.json.dumps(datetime(2024, 1, 1, tzinfo=timezone.utc)) == '"2024-01-01T00:00:00Z"'
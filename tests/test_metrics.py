@@ -0,0 +1,21 @@
+from app.services.metrics import metrics
+
+
+def test_metrics_are_off_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_require_the_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'token', 'scrape-me')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    client.get('/api/posts/suggest?q=a')
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert 'http_requests_total{endpoint="posts.suggest"' in response.get_data(as_text=True)
+
+
+def test_slow_requests_are_printed(client, monkeypatch, capsys):
+    monkeypatch.setattr(metrics, 'slow_request_ms', 0)
+    client.get('/api/posts/suggest?q=a')
+    assert 'Slow request GET /api/posts/suggest?q=a took' in capsys.readouterr().out
@@ -0,0 +1,24 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def flask_db(tmp_path, *args):
+    env = {**os.environ, 'DATABASE_URL': 'sqlite:///' + str(tmp_path / 'migrated.db'),
+           'FLASK_APP': str(ROOT / 'run.py'), 'PYTHONPATH': str(ROOT)}
+    return subprocess.run([sys.executable, '-m', 'flask', 'db', *args, '-d', str(ROOT / 'migrations')],
+                          cwd=tmp_path, env=env, capture_output=True, text=True)
+
+
+def test_migrations_build_the_models_schema(tmp_path):
+    upgraded = flask_db(tmp_path, 'upgrade')
+    assert upgraded.returncode == 0, upgraded.stderr
+    # Fails when a model changed without a migration
+    checked = flask_db(tmp_path, 'check')
+    assert checked.returncode == 0, checked.stdout + checked.stderr
+    downgraded = flask_db(tmp_path, 'downgrade', 'base')
+    assert downgraded.returncode == 0, downgraded.stderr
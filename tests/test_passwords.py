@@ -0,0 +1,21 @@
+from werkzeug.security import generate_password_hash
+from app.services.passwords import PasswordHasher
+import pytest
+
+
+@pytest.mark.parametrize('configured, stored, rehash', [
+    ('scrypt', 'scrypt', False),
+    ('scrypt', 'scrypt:32768:8:1', False),
+    ('scrypt:32768:8:1', 'scrypt', False),
+    ('scrypt:65536:8:1', 'scrypt', True),
+    ('pbkdf2', 'pbkdf2:sha256', False),
+    ('pbkdf2:sha256', 'pbkdf2', False),
+    ('pbkdf2:sha256:1000', 'pbkdf2:sha256', True),
+    ('pbkdf2:sha512', 'pbkdf2:sha256', True),
+    ('scrypt', 'pbkdf2', True),
+])
+def test_needs_rehash_compares_normalized_parameters(configured, stored, rehash):
+    hasher = PasswordHasher()
+    hasher.method = configured
+    hash_ = generate_password_hash('secret', stored)
+    assert hasher.needs_rehash(hash_) is rehash
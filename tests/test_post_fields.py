@@ -0,0 +1,18 @@
+def test_numbered_pages_keep_the_legacy_fields(client, add_posts):
+    add_posts(3)
+    posts = client.get('/api/posts/page/1').get_json()
+    assert set(posts[0]) == {'id', 'title', 'price', 'location', 'time', 'description', 'image', 'page'}
+    assert posts[0]['description'] == 'a post made by the test suite'
+
+
+def test_numbered_pages_trim_on_request(client, add_posts):
+    add_posts(3)
+    posts = client.get('/api/posts/page/1?fields=title,summary').get_json()
+    assert set(posts[0]) == {'id', 'title', 'summary', 'page'}
+
+
+def test_feed_leaves_the_description_to_the_detail_view(client, add_posts):
+    add_posts(3)
+    post = client.get('/api/posts/feed').get_json()['posts'][0]
+    assert 'description' not in post
+    assert 'summary' in post
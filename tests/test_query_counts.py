@@ -0,0 +1,45 @@
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app.extensions import db
+import pytest
+
+
+@pytest.fixture
+def statements(app):
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def statement_count(client, statements, url, headers=None):
+    # The first call warms the per-process caches, the second one is measured
+    assert client.get(url, headers=headers).status_code == 200
+    db.session.expunge_all()
+    statements.clear()
+    assert client.get(url, headers=headers).status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/posts/feed',
+    '/api/posts/feed?sort=price_asc&location=Kyiv',
+    '/api/posts/page/1',
+    '/api/profile/{seller}',
+    '/api/profile/{seller}/posts',
+    '/api/profile/my-profile'
+])
+def test_statement_count_does_not_grow_with_posts(app, client, add_posts, statements, url):
+    # From a partly filled first page to a full one, a query per post shows up as a difference
+    seller = add_posts(3, images=2)[0]
+    with app.test_request_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=str(seller))}
+    url = url.format(seller=seller)
+
+    before = statement_count(client, statements, url, headers)
+    add_posts(60, images=2)
+    assert statement_count(client, statements, url, headers) == before
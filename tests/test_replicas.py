@@ -0,0 +1,79 @@
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine, insert, select
+from app.extensions import db, jwt, redis_client, replica_router
+from app.models import User
+import fakeredis
+import pytest
+
+
+def database(path, email):
+    url = 'sqlite:///' + str(path)
+    engine = create_engine(url)
+    User.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(email=email, password='-'))
+    engine.dispose()
+    return url
+
+
+@pytest.fixture
+def routed_app(app, tmp_path, monkeypatch):
+    def make(replica_url):
+        # The router is a singleton, the session app's settings come back after the test
+        for name in ('keys', '_down', '_next_check', '_app', '_health'):
+            monkeypatch.setattr(replica_router, name, type(getattr(replica_router, name))())
+        # So does the db's list of binds, which init_app adds the replica to
+        monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+        routed = Flask(__name__)
+        routed.config.update(
+            SQLALCHEMY_DATABASE_URI=database(tmp_path / 'primary.db', 'primary'),
+            DATABASE_REPLICA_URLS=[replica_url],
+            REPLICA_STICKY_SECONDS=5, REPLICA_HEALTH_CHECK_SECONDS=3600, REPLICA_CONNECT_TIMEOUT=1,
+            JWT_SECRET_KEY=app.config['JWT_SECRET_KEY'])
+        replica_router.init_app(routed)
+        db.init_app(routed)
+        replica_router.install_engine_hooks(routed)
+        jwt.init_app(routed)
+
+        @routed.get('/read')
+        def read():
+            return db.session.execute(select(User.email)).scalar()
+
+        @routed.post('/write')
+        def write():
+            return 'ok'
+
+        with routed.app_context():
+            token = create_access_token(identity='1')
+        return routed.test_client(), {'Authorization': 'Bearer ' + token}
+    return make
+
+
+def test_anonymous_get_reads_from_the_replica(routed_app, tmp_path):
+    client, _ = routed_app(database(tmp_path / 'replica.db', 'replica'))
+    assert client.get('/read').text == 'replica'
+
+
+def test_get_after_write_reads_from_the_primary(routed_app, tmp_path):
+    client, headers = routed_app(database(tmp_path / 'replica.db', 'replica'))
+    assert client.get('/read', headers=headers).text == 'replica'
+    assert client.post('/write', headers=headers).status_code == 200
+    assert client.get('/read', headers=headers).text == 'primary'
+    # Other users are not held to the primary
+    assert client.get('/read').text == 'replica'
+
+
+def test_redis_error_reads_from_the_primary(routed_app, tmp_path, monkeypatch):
+    client, headers = routed_app(database(tmp_path / 'replica.db', 'replica'))
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, 'client', fakeredis.FakeRedis(server=server, decode_responses=True))
+    assert client.get('/read', headers=headers).text == 'primary'
+
+
+def test_failed_replica_falls_back_to_the_primary(routed_app, tmp_path):
+    client, _ = routed_app('sqlite:///' + str(tmp_path / 'missing' / 'replica.db'))
+    assert client.get('/read').text == 'primary'
+    assert replica_router.keys[0] in replica_router._down
+    assert client.get('/read').text == 'primary'
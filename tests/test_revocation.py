@@ -0,0 +1,55 @@
+from flask_jwt_extended import create_access_token, decode_token
+from app.extensions import redis_client
+from app.services.revocation import RevocationCache, revocation_cache
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def worker_cache(monkeypatch):
+    # The app's blocklist copy as a worker that has not seen any revocation yet
+    monkeypatch.setattr(revocation_cache, '_revoked', {})
+    monkeypatch.setattr(revocation_cache, '_synced_score', 0)
+    monkeypatch.setattr(revocation_cache, '_synced_at', 0)
+    monkeypatch.setattr(revocation_cache, '_next_sync', 0)
+    return revocation_cache
+
+
+@pytest.fixture
+def auth(app, add_posts):
+    seller = add_posts(1)[0]
+    with app.test_request_context():
+        token = create_access_token(identity=str(seller))
+    return {'Authorization': 'Bearer ' + token}, decode_token(token)['jti']
+
+
+def test_revocation_reaches_other_instances(client, auth, worker_cache):
+    headers, jti = auth
+    assert client.get('/api/profile/my-profile', headers=headers).status_code == 200
+
+    # Another worker or host logs the token out
+    RevocationCache().revoke(jti, 3600)
+    worker_cache._next_sync = 0
+    assert client.get('/api/profile/my-profile', headers=headers).status_code == 401
+
+
+def test_instances_share_revocations(fake_redis):
+    first, second = RevocationCache(), RevocationCache()
+    first.revoke('jti-1', 3600)
+    assert second.is_revoked('jti-1')
+    assert not second.is_revoked('jti-2')
+
+
+def test_stale_blocklist_rejects_every_token(client, auth, worker_cache, monkeypatch):
+    headers, _ = auth
+    assert client.get('/api/profile/my-profile', headers=headers).status_code == 200
+
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, 'client', fakeredis.FakeRedis(server=server, decode_responses=True))
+    # Within the bound the last pulled copy is still trusted
+    worker_cache._next_sync = 0
+    assert client.get('/api/profile/my-profile', headers=headers).status_code == 200
+
+    worker_cache._synced_at -= worker_cache.max_staleness + 1
+    assert client.get('/api/profile/my-profile', headers=headers).status_code == 401
@@ -0,0 +1,49 @@
+from pathlib import Path
+from types import SimpleNamespace
+from app.models import Post
+from app.services import search
+from app.services.search import MemorySearchBackend
+import os
+import pytest
+import subprocess
+import sys
+
+
+def test_writes_during_a_rebuild_reach_the_new_index(app, add_posts, monkeypatch):
+    add_posts(3)
+    backend = MemorySearchBackend(app)
+    first, second, _ = [post.id for post in Post.query.order_by(Post.id)]
+    document_terms = search.document_terms
+
+    def write_while_reading(title, description):
+        # Another request of this worker commits while the build is halfway through its snapshot
+        if not write_while_reading.done:
+            write_while_reading.done = True
+            backend.index_post(SimpleNamespace(id=first, title='Bicycle', description='barely used'))
+            backend.remove_post(second)
+            backend.index_post(SimpleNamespace(id=999, title='Brand new kayak', description=None))
+        return document_terms(title, description)
+    write_while_reading.done = False
+    monkeypatch.setattr(search, 'document_terms', write_while_reading)
+
+    backend.rebuild()
+
+    assert backend.search('bicycle', 0, 10, 100)[0] == [first]
+    assert backend.search('kayak', 0, 10, 100)[0] == [999]
+    assert second not in backend.search('post', 0, 10, 100)[0]
+    # The build is over, writes now go straight to the index
+    backend.remove_post(999)
+    assert backend.search('kayak', 0, 10, 100)[0] == []
+
+
+@pytest.mark.parametrize('url, backend', [
+    ('mysql://user:pass@db/bazarchik', 'mysql'),
+    ('mysql+pymysql://user:pass@db/bazarchik', 'mysql'),
+    ('sqlite:///bazarchik.db', 'memory'),
+])
+def test_backend_follows_the_database(url, backend):
+    env = {**os.environ, 'DATABASE_URL': url}
+    env.pop('SEARCH_BACKEND', None)
+    chosen = subprocess.run([sys.executable, '-c', 'from app.config import Config; print(Config.SEARCH_BACKEND)'],
+                            cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True).stdout.strip()
+    assert chosen == backend
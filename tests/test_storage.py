@@ -0,0 +1,26 @@
+from app.extensions import db
+from app.models import PostImage, StoredObject
+from app.services.storage import migrate_legacy_uploads
+import os
+
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + b'\x00' * 64
+
+
+def test_migrated_files_are_named_by_their_content(app, add_posts):
+    add_posts(1, sellers=1, images=1)
+    image = PostImage.query.one()
+    image.filename = 'post_image1.png'
+    db.session.commit()
+    os.makedirs(image.post.img_path, exist_ok=True)
+    with open(image.path, 'wb') as f:
+        f.write(JPEG)
+
+    report = migrate_legacy_uploads()
+
+    assert report['stored'] == 1
+    obj = StoredObject.query.one()
+    assert obj.ext == '.jpg'
+    assert PostImage.query.one().filename == obj.path
+    with open(obj.path, 'rb') as f:
+        assert f.read() == JPEG